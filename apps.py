@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class SearchConfig(AppConfig):
+    name = __name__.rpartition('.')[0]
+
+    def ready(self):
+        # Connects the receivers that keep scope versions, suggestions and
+        # search documents in step with the searched models.
+        from . import signals  # noqa
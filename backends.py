@@ -0,0 +1,273 @@
+import re
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, IntegerField, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from apps.api.filters import CommonProfileFilter, CommonCommunityFilter, CommonAudioFilter, CommonVideoFilter, \
+    CommonTextFilter
+
+from .models import SearchDocument
+from .query import SearchQuery
+from .scopes import MODELS_BY_SCOPE, ORDERING_BY_SCOPE, SEARCH_FIELDS_BY_SCOPE, get_visible_queryset
+from .snapshot import SNAPSHOT_SCOPES, get_search_snapshot
+
+
+def get_search_backend():
+    backend_class = getattr(settings, 'SEARCH_BACKEND', None) or ORMFilterBackend
+    if isinstance(backend_class, str):
+        backend_class = import_string(backend_class)
+    return backend_class()
+
+
+class BaseSearchBackend(object):
+    """
+    Matches the `name` of a search against the rows of one scope. The queryset
+    passed in already carries the scope's visibility rules.
+    """
+
+    # Whether get_page_hits() and get_hit_ids() page and list hits without
+    # the queryset of the scope.
+    pages_hits = False
+
+    def filter_queryset(self, scope, queryset, filter_dict):
+        raise NotImplementedError
+
+    def get_ordering(self, scope, ordering):
+        return ordering
+
+    def get_page_hits(self, scope, filter_dict, paginator):
+        """
+        Pages and counts the hits of one scope without going through its
+        queryset: returns the primary keys of up to paginator.limit + 1 hits
+        after the cursor and the number of all hits, or None when the
+        queryset has to be used.
+        """
+        return None
+
+    def get_hit_ids(self, scope, filter_dict):
+        """
+        The primary keys of every hit of one scope in result order, or None
+        when the queryset has to be used.
+        """
+        return None
+
+    def get_grouped_hits(self, filter_dict, limits):
+        """
+        Searches several scopes at once; returns None when the backend has to
+        be queried scope by scope instead. Hits are in the order of
+        get_ordering().
+        """
+        return None
+
+
+class ORMFilterBackend(BaseSearchBackend):
+
+    FILTER_CLASSES_BY_SCOPE = {
+        'profiles': CommonProfileFilter,
+        'communities': CommonCommunityFilter,
+        'video': CommonVideoFilter,
+        'audio': CommonAudioFilter,
+        'text': CommonTextFilter,
+    }
+
+    def filter_queryset(self, scope, queryset, filter_dict):
+        if scope == 'posts':
+            return queryset.filter(title__istartswith=filter_dict.get('name'))
+        filter_class = self.FILTER_CLASSES_BY_SCOPE[scope]
+        tokens = SearchQuery(filter_dict.get('name')).tokens
+        if scope != 'profiles' or len(tokens) < 2:
+            return filter_class(filter_dict, queryset=queryset).qs
+        # Every word of a full name has to match one of the name fields on
+        # its own; the other parameters only need to be applied once.
+        first_filter_dict = filter_dict.copy()
+        first_filter_dict['name'] = tokens[0]
+        queryset = filter_class(first_filter_dict, queryset=queryset).qs
+        for token in tokens[1:]:
+            queryset = filter_class({'name': token}, queryset=queryset).qs
+        return queryset
+
+
+def get_document_sql(model, fields, qualified=True):
+    """
+    The tsvector expression the full-text GIN indexes are built on. Queries must
+    use exactly the same expression for PostgreSQL to pick the index up.
+    """
+    columns = []
+    for name in fields:
+        column = '"{}"'.format(model._meta.get_field(name).column)
+        if qualified:
+            column = '"{}".{}'.format(model._meta.db_table, column)
+        columns.append("coalesce({}, '')".format(column))
+    return "to_tsvector('simple', {})".format(" || ' ' || ".join(columns))
+
+
+def get_fulltext_index_name(model):
+    return 'search_fts_{}'.format(model._meta.db_table)
+
+
+def get_create_fulltext_index_sql(model, fields):
+    return "CREATE INDEX CONCURRENTLY IF NOT EXISTS \"{}\" ON \"{}\" USING gin (({}))".format(
+        get_fulltext_index_name(model), model._meta.db_table, get_document_sql(model, fields, qualified=False)
+    )
+
+
+def get_drop_fulltext_index_sql(model):
+    return "DROP INDEX CONCURRENTLY IF EXISTS \"{}\"".format(get_fulltext_index_name(model))
+
+
+class PostgresFullTextBackend(BaseSearchBackend):
+    """
+    Matches every word of `name` as a prefix against the scope's
+    SEARCH_FIELDS_BY_SCOPE and ranks the hits with ts_rank. The other filter
+    parameters still go through the ORM filters. Its GIN indexes are built
+    with the search_fulltext_indexes command.
+    """
+
+    def get_tsquery(self, name):
+        words = re.findall(r'\w+', name or '', re.UNICODE)
+        return ' & '.join('{}:*'.format(word) for word in words)
+
+    def filter_queryset(self, scope, queryset, filter_dict):
+        tsquery = self.get_tsquery(filter_dict.get('name'))
+        if scope != 'posts':
+            filter_dict = filter_dict.copy()
+            filter_dict['name'] = ''
+            queryset = ORMFilterBackend().filter_queryset(scope, queryset, filter_dict)
+
+        if not tsquery:
+            return queryset.none()
+
+        document = get_document_sql(queryset.model, SEARCH_FIELDS_BY_SCOPE[scope])
+        return queryset.annotate(
+            search_rank=RawSQL(
+                "ts_rank({}, to_tsquery('simple', %s))::float8".format(document), (tsquery,), output_field=FloatField()
+            )
+        ).extra(
+            where=["{} @@ to_tsquery('simple', %s)".format(document)], params=[tsquery]
+        )
+
+    def get_ordering(self, scope, ordering):
+        return ('-search_rank',) + tuple(ordering)
+
+
+class SearchDocumentBackend(BaseSearchBackend):
+    """
+    Matches `name` against the SearchDocument table instead of the entity
+    tables and ranks the hits by match tier (exact, prefix, then a later
+    word), then by the precomputed recency and popularity score. An unscoped
+    search is answered by one grouped query over the table.
+    """
+
+    def get_documents(self, filter_dict):
+        name = filter_dict.get('name')
+        return SearchDocument.objects.visible().matching(name).with_match_tier(name)
+
+    def filter_queryset(self, scope, queryset, filter_dict):
+        if scope != 'posts':
+            filter_dict = filter_dict.copy()
+            filter_dict['name'] = ''
+            queryset = ORMFilterBackend().filter_queryset(scope, queryset, filter_dict)
+        documents = self.get_documents(filter_dict).filter(scope=scope)
+        # Only evaluated for the matching rows, each one a lookup on (scope, object_id).
+        document = documents.filter(object_id=OuterRef('pk'))
+        return queryset.filter(pk__in=documents.values('object_id')).annotate(
+            search_tier=Subquery(document.values('match_tier')[:1], output_field=IntegerField()),
+            search_score=Subquery(document.values('score')[:1], output_field=FloatField())
+        )
+
+    def get_ordering(self, scope, ordering):
+        return ('search_tier', '-search_score', 'pk')
+
+    def get_grouped_hits(self, filter_dict, limits):
+        """
+        Returns an OrderedDict of the primary keys of the first limits[scope]
+        + 1 hits and the number of hits of every scope of limits, along with
+        the search_tier and search_score of every primary key.
+        """
+        documents = self.get_documents(filter_dict).filter(scope__in=list(limits))
+        sql, params = documents.values_list('scope', 'object_id', 'match_tier', 'score').query.sql_with_params()
+        grouped_sql = (
+            "SELECT scope, object_id, match_tier, score, total FROM ("
+            "SELECT d.*, "
+            "row_number() OVER (PARTITION BY d.scope ORDER BY d.match_tier, d.score DESC, d.object_id) AS position, "
+            "count(*) OVER (PARTITION BY d.scope) AS total "
+            "FROM ({}) d"
+            ") hits WHERE position <= %s ORDER BY position"
+        ).format(sql)
+
+        hits = OrderedDict((scope, {'pks': [], 'count': 0, 'annotations': {}}) for scope in limits)
+        with connection.cursor() as cursor:
+            cursor.execute(grouped_sql, tuple(params) + (max(limits.values()) + 1,))
+            for scope, object_id, match_tier, score, total in cursor.fetchall():
+                if len(hits[scope]['pks']) <= limits[scope]:
+                    hits[scope]['pks'].append(object_id)
+                    hits[scope]['annotations'][object_id] = {'search_tier': match_tier, 'search_score': score}
+                hits[scope]['count'] = total
+        return hits
+
+
+class SnapshotBackend(BaseSearchBackend):
+    """
+    Matches `name` against the in-process snapshot of the scopes that look the
+    same to every viewer (see snapshot.py): as a prefix of the title, or
+    anywhere in it with SEARCH_SNAPSHOT_MATCH = 'infix'. Profiles and scopes
+    too large for the snapshot go through the ORM filters. Searches with no
+    other filter parameters are paged and counted in the snapshot, so the
+    database only loads the rows of the page (and matches the profiles).
+    """
+
+    pages_hits = True
+
+    def get_match(self):
+        return getattr(settings, 'SEARCH_SNAPSHOT_MATCH', 'prefix')
+
+    def get_snapshots(self, scopes):
+        return get_search_snapshot().get([scope for scope in scopes if scope in SNAPSHOT_SCOPES])
+
+    def filter_queryset(self, scope, queryset, filter_dict):
+        snapshot = self.get_snapshots([scope]).get(scope)
+        if snapshot is None:
+            return ORMFilterBackend().filter_queryset(scope, queryset, filter_dict)
+        name = filter_dict.get('name')
+        if scope != 'posts':
+            filter_dict = filter_dict.copy()
+            filter_dict['name'] = ''
+            queryset = ORMFilterBackend().filter_queryset(scope, queryset, filter_dict)
+        return queryset.filter(pk__in=snapshot.get_ids(snapshot.search(name, self.get_match())))
+
+    def get_page_hits(self, scope, filter_dict, paginator):
+        snapshot = self.get_snapshots([scope]).get(scope)
+        if snapshot is None:
+            return None
+        positions = snapshot.search(filter_dict.get('name'), self.get_match())
+        count = len(positions)
+        if paginator.cursor is not None:
+            positions = snapshot.skip_past(
+                positions, paginator.ordering, paginator.decode_cursor(MODELS_BY_SCOPE[scope])
+            )
+        return {'pks': snapshot.get_ids(positions[:paginator.limit + 1]), 'count': count}
+
+    def get_hit_ids(self, scope, filter_dict):
+        snapshot = self.get_snapshots([scope]).get(scope)
+        if snapshot is None:
+            return None
+        return snapshot.get_ids(snapshot.search(filter_dict.get('name'), self.get_match()))
+
+    def get_grouped_hits(self, filter_dict, limits):
+        snapshots = self.get_snapshots(limits)
+        name = filter_dict.get('name')
+        hits = OrderedDict()
+        for scope, limit in limits.items():
+            snapshot = snapshots.get(scope)
+            if snapshot is not None:
+                positions = snapshot.search(name, self.get_match())
+                hits[scope] = {'pks': snapshot.get_ids(positions[:limit + 1]), 'count': len(positions)}
+                continue
+            queryset = ORMFilterBackend().filter_queryset(scope, get_visible_queryset(scope), filter_dict)
+            pks = list(queryset.order_by(*ORDERING_BY_SCOPE[scope]).values_list('pk', flat=True)[:limit + 1])
+            hits[scope] = {'pks': pks, 'count': len(pks) if len(pks) <= limit else queryset.count()}
+        return hits
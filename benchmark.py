@@ -0,0 +1,171 @@
+import math
+import random
+import time
+import tracemalloc
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.abstract.utils import create_user_with_profile
+from apps.communities.models import Community, CommunitySubject
+from apps.galleries.models import VideoItem, AudioItem, TextItem
+from apps.posts.models import Post
+
+WORDS = (
+    'found', 'other', 'alpha', 'amber', 'anna', 'boris', 'city', 'dawn', 'echo', 'faith', 'forest', 'fountain',
+    'grace', 'harbor', 'ivan', 'john', 'light', 'maria', 'morning', 'music', 'olga', 'peace', 'river', 'song',
+    'stone', 'sun', 'valley', 'voice', 'word', 'youth',
+)
+
+DEFAULT_VOLUMES = {
+    'users': 200,
+    'communities': 100,
+    'items': 500,
+    'posts': 500,
+    'friends': 50,
+    'followeds': 50,
+    'followers': 50,
+}
+
+SCOPE_COMBINATIONS = (
+    (None, None),
+    ('profiles', None),
+    ('profiles', 'friends'),
+    ('profiles', 'others'),
+    ('profiles', 'followeds'),
+    ('profiles', 'followers'),
+    ('communities', None),
+    ('video', None),
+    ('audio', None),
+    ('text', None),
+    ('posts', None),
+)
+
+
+def get_title(rng, words=3):
+    return ' '.join(rng.choice(WORDS).capitalize() for i in range(words))
+
+
+def seed_search_data(volumes, seed=0):
+    """
+    Fills the database with synthetic search data and returns the user the
+    searches should run as. volumes overrides DEFAULT_VOLUMES; 'items' is the
+    number of rows per gallery item type.
+    """
+    volumes = dict(DEFAULT_VOLUMES, **volumes)
+    rng = random.Random(seed)
+
+    viewer, viewer_profile = create_user_with_profile('viewer@benchmark.test')
+    users = [
+        create_user_with_profile(
+            'user{}@benchmark.test'.format(index),
+            first_name=rng.choice(WORDS).capitalize(),
+            last_name=rng.choice(WORDS).capitalize()
+        ) for index in range(volumes['users'])
+    ]
+
+    related_users = rng.sample(users, min(len(users), volumes['friends'] + volumes['followeds'] + volumes['followers']))
+    for user, profile in related_users[:volumes['friends']]:
+        viewer_profile.friend_user(user)
+    for user, profile in related_users[volumes['friends']:volumes['friends'] + volumes['followeds']]:
+        viewer_profile.follow_user(user)
+    for user, profile in related_users[volumes['friends'] + volumes['followeds']:]:
+        profile.follow_user(viewer)
+
+    subject = CommunitySubject.objects.create(name="benchmark", code="benchmark")
+    for index in range(volumes['communities']):
+        Community.objects.create(name=get_title(rng), subject=subject, author=rng.choice(users)[0])
+
+    gallery_models = (
+        (VideoItem, {'source': "youtube", 'source_id': "benchmark", 'source_duration': 60}),
+        (AudioItem, {}),
+        (TextItem, {}),
+    )
+    for model, extra in gallery_models:
+        items = []
+        for index in range(volumes['items']):
+            author, author_profile = rng.choice(users)
+            items.append(model(
+                author=author,
+                gallery=None,
+                title=get_title(rng),
+                content_object=author_profile,
+                submitted=True,
+                **extra
+            ))
+        model.objects.bulk_create(items, batch_size=1000)
+
+    posts = []
+    for index in range(volumes['posts']):
+        author, author_profile = rng.choice(users)
+        posts.append(Post(title=get_title(rng), text=get_title(rng, 30), author=author, content_object=author_profile))
+    Post.objects.bulk_create(posts, batch_size=1000)
+
+    return viewer
+
+
+def get_percentile(values, percentile):
+    values = sorted(values)
+    return values[max(0, int(math.ceil(percentile / 100.0 * len(values))) - 1)]
+
+
+def count_rows(data):
+    return sum(len(value) for key, value in data.items() if isinstance(value, list))
+
+
+def run_search_benchmark(viewer, names, repeat=10, extra_params=None):
+    """
+    Requests every scope and scope_2 combination for every name `repeat` times
+    and returns one report dict per combination. Peak memory comes from one
+    more, untimed, request of each.
+    """
+    client = APIClient()
+    client.force_authenticate(user=viewer)
+    url = reverse('api_common_search')
+
+    reports = []
+    for name in names:
+        for scope, scope_2 in SCOPE_COMBINATIONS:
+            params = dict(extra_params or {}, name=name)
+            if scope:
+                params['scope'] = scope
+            if scope_2:
+                params['scope_2'] = scope_2
+
+            durations, queries, sql_times, rows = [], [], [], []
+            for index in range(repeat):
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = client.get(url, params)
+                    durations.append((time.perf_counter() - started) * 1000)
+                queries.append(len(context.captured_queries))
+                sql_times.append(sum(float(query['time']) for query in context.captured_queries) * 1000)
+                rows.append(count_rows(response.data))
+
+            # tracemalloc slows every allocation down, so memory is measured
+            # in a request of its own rather than in the timed ones.
+            tracemalloc.start()
+            try:
+                client.get(url, params)
+                peak = tracemalloc.get_traced_memory()[1] / 1024.0
+            finally:
+                tracemalloc.stop()
+
+            reports.append({
+                'name': name,
+                'scope': scope,
+                'scope_2': scope_2,
+                'status': response.status_code,
+                'requests': repeat,
+                'p50_ms': round(get_percentile(durations, 50), 3),
+                'p90_ms': round(get_percentile(durations, 90), 3),
+                'p99_ms': round(get_percentile(durations, 99), 3),
+                'max_ms': round(max(durations), 3),
+                'queries': max(queries),
+                'sql_ms': round(get_percentile(sql_times, 50), 3),
+                'rows': max(rows),
+                'peak_memory_kb': round(peak, 1),
+            })
+    return reports
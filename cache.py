@@ -0,0 +1,112 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION_KEY_PREFIX = 'search:version:'
+
+
+class LocalLRUCache(object):
+    """
+    A process-local cache with per-entry timeouts that evicts the least
+    recently used entry once max_entries is reached.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires <= time.time():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self.lock:
+            self.data[key] = (value, time.time() + timeout if timeout else None)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Returns the cache search hits are stored in: the SEARCH_CACHE_ALIAS cache
+    when it is set, a LocalLRUCache of SEARCH_CACHE_MAX_ENTRIES otherwise.
+    """
+    global _local_cache
+    alias = getattr(settings, 'SEARCH_CACHE_ALIAS', None)
+    if alias:
+        return caches[alias]
+    with _local_cache_lock:
+        if _local_cache is None:
+            _local_cache = LocalLRUCache(getattr(settings, 'SEARCH_CACHE_MAX_ENTRIES', 10000))
+        return _local_cache
+
+
+def get_result_cache_timeout():
+    """Caching is off unless SEARCH_CACHE_TIMEOUT is set to a number of seconds."""
+    return getattr(settings, 'SEARCH_CACHE_TIMEOUT', None)
+
+
+def get_version_cache():
+    # Versions have to be shared by every process for invalidation to reach them.
+    return caches[getattr(settings, 'SEARCH_VERSION_CACHE_ALIAS', 'default')]
+
+
+def get_versions(names):
+    versions = get_version_cache().get_many([VERSION_KEY_PREFIX + name for name in names])
+    return dict((name, versions.get(VERSION_KEY_PREFIX + name, 0)) for name in names)
+
+
+def bump_version(name):
+    version_cache = get_version_cache()
+    key = VERSION_KEY_PREFIX + name
+    version_cache.add(key, 0, None)
+    try:
+        return version_cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr().
+        version_cache.set(key, 1, None)
+        return 1
+
+
+def make_result_cache_key(scope, versions, params):
+    digest = hashlib.sha1(json.dumps([scope, versions, params], sort_keys=True).encode()).hexdigest()
+    return 'search:result:{}:{}'.format(scope, digest)
+
+
+def make_etag(versions, params):
+    return '"{}"'.format(hashlib.sha1(json.dumps([versions, params], sort_keys=True).encode()).hexdigest())
+
+
+def etag_matches(etag, if_none_match):
+    """The weak comparison RFC 7232 asks for If-None-Match."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
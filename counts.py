@@ -0,0 +1,55 @@
+import json
+
+from django.db import connections
+
+COUNT_STRATEGIES = ('exact', 'capped', 'estimate')
+
+
+def estimate_count(queryset):
+    """
+    The number of rows the PostgreSQL planner expects queryset to return, or
+    None on other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_counted_queryset(queryset, strategy='exact', threshold=1000):
+    """The queryset whose COUNT(*) count_queryset() runs."""
+    queryset = queryset.order_by().values('pk')
+    return queryset if strategy == 'exact' else queryset[:threshold + 1]
+
+
+def get_count(queryset, counted, strategy='exact', threshold=1000):
+    """
+    Turns the number of rows of get_counted_queryset() into the count of
+    queryset and whether it is exact.
+    """
+    if strategy == 'exact' or counted <= threshold:
+        return counted, True
+    if strategy == 'estimate':
+        estimate = estimate_count(queryset)
+        if estimate is not None:
+            return max(estimate, counted), False
+    return threshold, False
+
+
+def count_queryset(queryset, strategy='exact', threshold=1000):
+    """
+    Returns the number of rows of queryset and whether it is exact.
+
+    'exact' always runs COUNT(*). 'capped' and 'estimate' only count up to
+    threshold + 1 rows; past the threshold 'capped' reports the threshold
+    itself and 'estimate' the planner estimate, never less than the rows
+    already seen.
+    """
+    counted = get_counted_queryset(queryset, strategy, threshold).count()
+    return get_count(queryset, counted, strategy, threshold)
@@ -0,0 +1,170 @@
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import SearchDocument, SearchDocumentUpdate
+from .query import normalize
+from .scopes import MODELS_BY_SCOPE, SEARCH_FIELDS_BY_SCOPE, get_label, get_visible_queryset
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Precomputed into SearchDocument.popularity; scopes without an entry rank
+# by match quality and recency alone. The counters of posts and communities
+# are columns of their own rows, so saving the row refreshes its document.
+POPULARITY_BY_SCOPE = {
+    'profiles': Count('user__followers', distinct=True),
+    'communities': F('members_count'),
+    'posts': F('likes_count'),
+}
+
+
+def get_date_field(scope):
+    try:
+        return MODELS_BY_SCOPE[scope]._meta.get_field('date_created').name
+    except FieldDoesNotExist:
+        return None
+
+
+def get_document_rows(scope, queryset):
+    """
+    The values of the entities of queryset a SearchDocument is built from,
+    as dicts with the search fields, 'pk', 'date_created' when the model has
+    one and 'search_popularity' when the scope has a popularity signal.
+    """
+    fields = ('pk',) + SEARCH_FIELDS_BY_SCOPE[scope]
+    date_field = get_date_field(scope)
+    if date_field:
+        fields += (date_field,)
+    popularity = POPULARITY_BY_SCOPE.get(scope)
+    if popularity is not None:
+        queryset = queryset.annotate(search_popularity=popularity)
+        fields += ('search_popularity',)
+    return queryset.values(*fields)
+
+
+def get_score(popularity, date_created):
+    """
+    Seconds since the epoch plus SEARCH_RANK_POPULARITY_SECONDS per e-fold of
+    popularity, so that ordering by it is ordering by popularity decayed with
+    age, without the score of older documents ever having to be refreshed.
+    """
+    score = getattr(settings, 'SEARCH_RANK_POPULARITY_SECONDS', 7 * 24 * 3600) * math.log1p(popularity)
+    if date_created is not None:
+        epoch = EPOCH if timezone.is_aware(date_created) else timezone.make_naive(EPOCH, timezone.utc)
+        score += (date_created - epoch).total_seconds()
+    return score
+
+
+def make_search_document(scope, values, is_visible):
+    date_created = values.get(get_date_field(scope))
+    popularity = float(values.get('search_popularity') or 0)
+    return SearchDocument(
+        scope=scope,
+        object_id=values['pk'],
+        text=normalize(get_label([values[name] for name in SEARCH_FIELDS_BY_SCOPE[scope]]), casefold=False),
+        is_visible=is_visible,
+        date_created=date_created,
+        popularity=popularity,
+        score=get_score(popularity, date_created)
+    )
+
+
+def replace_search_documents(scope, pks):
+    """
+    Brings the documents of the given primary keys of a scope in line with
+    the entity table: the old rows are deleted and the current ones bulk
+    created in one transaction, which also drops documents of removed
+    entities. Visibility is read back through the scope's own queryset, so
+    documents follow whatever visible_to_all() or not_deleted() decide.
+    """
+    rows = list(get_document_rows(scope, MODELS_BY_SCOPE[scope].objects.filter(pk__in=pks)))
+    visible_pks = set(
+        get_visible_queryset(scope).filter(pk__in=[row['pk'] for row in rows]).values_list('pk', flat=True)
+    ) if rows else set()
+    documents = [make_search_document(scope, row, row['pk'] in visible_pks) for row in rows]
+    try:
+        with transaction.atomic():
+            SearchDocument.objects.filter(scope=scope, object_id__in=pks).delete()
+            SearchDocument.objects.bulk_create(documents)
+    except IntegrityError:
+        # Another worker inserted documents of some of the same entities after
+        # our delete; the insert waited for its commit, so the retry's delete
+        # sees its rows.
+        with transaction.atomic():
+            SearchDocument.objects.filter(scope=scope, object_id__in=pks).delete()
+            SearchDocument.objects.bulk_create(documents)
+    return len(rows)
+
+
+def enqueue_search_document_updates(scope, pks):
+    # Saves and deletes are queued alike: the worker reads the entity back
+    # and finds out which one it was.
+    SearchDocumentUpdate.objects.bulk_create([SearchDocumentUpdate(scope=scope, object_id=pk) for pk in pks])
+
+
+def process_search_document_updates(batch_size=1000):
+    """
+    Applies up to batch_size queued updates, coalesced to one per entity and
+    replaced scope by scope. Rows locked by another worker are skipped, so
+    several workers can run at once; two of them replacing the documents of
+    the same entity are reconciled in replace_search_documents().
+
+    Returns the number of queued updates and of entities processed.
+    """
+    with transaction.atomic():
+        updates = list(
+            SearchDocumentUpdate.objects.select_for_update(skip_locked=True).order_by('pk').values_list(
+                'pk', 'scope', 'object_id'
+            )[:batch_size]
+        )
+        pks_by_scope = {}
+        for pk, scope, object_id in updates:
+            pks_by_scope.setdefault(scope, set()).add(object_id)
+        for scope, pks in pks_by_scope.items():
+            replace_search_documents(scope, list(pks))
+        SearchDocumentUpdate.objects.filter(pk__in=[update[0] for update in updates]).delete()
+    return len(updates), sum(len(pks) for pks in pks_by_scope.values())
+
+
+def get_search_document_lag():
+    """The number of queued updates and the age in seconds of the oldest one."""
+    queue = SearchDocumentUpdate.objects.aggregate(pending=Count('pk'), oldest=Min('date_queued'))
+    return queue['pending'], (timezone.now() - queue['oldest']).total_seconds() if queue['oldest'] else 0.0
+
+
+def rebuild_search_documents(scopes=None, batch_size=1000):
+    """
+    Replaces the documents of the given scopes (all of them by default) with
+    ones built from the entity tables, batch_size rows at a time. Each scope
+    is swapped in one transaction, so searches never see it half built.
+
+    Returns the number of documents written per scope.
+    """
+    counts = {}
+    for scope in scopes or MODELS_BY_SCOPE:
+        model = MODELS_BY_SCOPE[scope]
+        counts[scope] = 0
+        with transaction.atomic():
+            SearchDocument.objects.filter(scope=scope).delete()
+            last_pk = None
+            while True:
+                rows = model.objects.order_by('pk')
+                if last_pk is not None:
+                    rows = rows.filter(pk__gt=last_pk)
+                rows = list(get_document_rows(scope, rows)[:batch_size])
+                if not rows:
+                    break
+                visible_pks = set(
+                    get_visible_queryset(scope).filter(pk__in=[row['pk'] for row in rows]).values_list('pk', flat=True)
+                )
+                SearchDocument.objects.bulk_create([
+                    make_search_document(scope, row, row['pk'] in visible_pks) for row in rows
+                ])
+                counts[scope] += len(rows)
+                last_pk = rows[-1]['pk']
+    return counts
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executors = {}
+_executors_lock = threading.Lock()
+_background_keys = set()
+_background_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(max_workers=max_workers)
+        return executor
+
+
+def call_with_connection_cleanup(function, args):
+    # Every worker thread gets its own connection; it is released here the same
+    # way Django releases it at the end of a request, honouring CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+def map_concurrently(function, args_list, max_workers=None):
+    """
+    Calls function once for every tuple in args_list and returns the results in
+    the same order. With max_workers below 2 the calls run one after another in
+    the current thread.
+    """
+    if not max_workers or max_workers < 2 or len(args_list) < 2:
+        return [function(*args) for args in args_list]
+
+    executor = get_executor(max_workers)
+    futures = [executor.submit(call_with_connection_cleanup, function, args) for args in args_list]
+    return [future.result() for future in futures]
+
+
+def run_in_background(key, function, *args):
+    """
+    Calls function in a daemon thread unless one started under the same key is
+    still running. With SEARCH_BACKGROUND_REBUILDS off the call is made right
+    away in the current thread instead.
+    """
+    if not getattr(settings, 'SEARCH_BACKGROUND_REBUILDS', True):
+        function(*args)
+        return
+
+    with _background_lock:
+        if key in _background_keys:
+            return
+        _background_keys.add(key)
+
+    def run():
+        try:
+            call_with_connection_cleanup(function, args)
+        finally:
+            with _background_lock:
+                _background_keys.discard(key)
+
+    threading.Thread(target=run, name='search-{}'.format(key), daemon=True).start()
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...benchmark import DEFAULT_VOLUMES, run_search_benchmark, seed_search_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database with synthetic search data and reports latency percentiles, "
+        "SQL queries, rows and peak memory for every scope and scope_2 combination of the search endpoint."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in sorted(DEFAULT_VOLUMES.items()):
+            parser.add_argument('--{}'.format(name), type=int, default=default)
+        parser.add_argument('--names', default='an,fo,found,found other', help="Comma separated search terms.")
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            viewer = seed_search_data(
+                dict((name, options[name]) for name in DEFAULT_VOLUMES), seed=options['seed']
+            )
+            reports = run_search_benchmark(viewer, options['names'].split(','), repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = json.dumps({
+            'volumes': dict((name, options[name]) for name in DEFAULT_VOLUMES),
+            'repeat': options['repeat'],
+            'results': reports,
+        }, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
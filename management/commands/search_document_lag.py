@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...documents import get_search_document_lag
+
+
+class Command(BaseCommand):
+    help = "Reports the number of queued SearchDocument updates and the age of the oldest one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-lag', type=float, help="Fail when the oldest update is older than this, in seconds.")
+
+    def handle(self, *args, **options):
+        pending, lag = get_search_document_lag()
+        self.stdout.write("{} pending, lag {:.1f} s".format(pending, lag))
+        if options['max_lag'] is not None and lag > options['max_lag']:
+            raise CommandError("Search document lag of {:.1f} s exceeds {:.1f} s".format(lag, options['max_lag']))
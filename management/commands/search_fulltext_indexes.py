@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...backends import get_create_fulltext_index_sql, get_drop_fulltext_index_sql
+from ...scopes import MODELS_BY_SCOPE, SEARCH_FIELDS_BY_SCOPE
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the full-text GIN indexes PostgresFullTextBackend searches, which migrating does not build, "
+        "or drops them with --drop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Full-text indexes need PostgreSQL")
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction, so every
+        # statement is committed on its own.
+        with connection.cursor() as cursor:
+            for scope, model in sorted(MODELS_BY_SCOPE.items()):
+                if options['drop']:
+                    cursor.execute(get_drop_fulltext_index_sql(model))
+                else:
+                    cursor.execute(get_create_fulltext_index_sql(model, SEARCH_FIELDS_BY_SCOPE[scope]))
+                self.stdout.write("{}: {}".format(scope, "dropped" if options['drop'] else "built"))
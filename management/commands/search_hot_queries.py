@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+
+from ...cache import get_result_cache_timeout
+from ...querylog import get_hot_queries
+from ...views import CommonSearchAPI
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the most frequent searches of the sampled search query log and, with --prewarm, runs the first "
+        "page of each of them into the result cache, e.g. after a deploy or a cache flush. Profile results depend "
+        "on the viewer and are not pre-warmed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--days', type=float, default=7, help="Only count searches of the last DAYS days.")
+        parser.add_argument('--prewarm', action='store_true')
+
+    def prewarm(self, name, scope):
+        request = Request(RequestFactory().get('/', {'name': name, 'scope': scope} if scope else {'name': name}))
+        request.user = AnonymousUser()
+        view = CommonSearchAPI()
+        view.request, view.args, view.kwargs, view.format_kwarg = request, (), {}, None
+        warmed = 0
+        for key in [scope] if scope else view.SCOPES:
+            if key == 'profiles':
+                continue
+            prefix = '' if scope else '{}_'.format(key)
+            view.get_cached_scope_hits(key, view.get_paginator(key, prefix), fields=view.get_fields(key, prefix))
+            warmed += 1
+        return warmed
+
+    def handle(self, *args, **options):
+        if options['prewarm'] and not get_result_cache_timeout():
+            raise CommandError("SEARCH_CACHE_TIMEOUT is not set, so there is no result cache to pre-warm")
+
+        warmed = 0
+        for query in get_hot_queries(options['top'], timezone.now() - timedelta(days=options['days'])):
+            self.stdout.write("{:>7} {!r} scope={} scope_2={}: {:.1f} ms, {:.0f} results, {:.0f}% cached".format(
+                query['hits'],
+                query['name'],
+                query['scope'] or 'all',
+                query['scope_2'] or '-',
+                query['avg_duration'],
+                query['avg_result_count'],
+                100.0 * query['cache_hits'] / query['hits']
+            ))
+            if options['prewarm'] and not query['scope_2']:
+                warmed += self.prewarm(query['name'], query['scope'])
+        if options['prewarm']:
+            self.stdout.write("{} result cache entries pre-warmed".format(warmed))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...documents import get_search_document_lag, process_search_document_updates
+from ...metrics import get_metrics_sink
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies the queued SearchDocument updates in batches, then keeps polling the queue every --interval "
+        "seconds unless --once is given. The queue lag is sent to SEARCH_METRICS_SINK after every pass."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            updates = entities = 0
+            while True:
+                batch_updates, batch_entities = process_search_document_updates(options['batch_size'])
+                updates += batch_updates
+                entities += batch_entities
+                if batch_updates < options['batch_size']:
+                    break
+
+            pending, lag = get_search_document_lag()
+            sink = get_metrics_sink()
+            if sink is not None:
+                sink.timing('search.documents.lag', lag * 1000, {})
+                sink.increment('search.documents.updates', updates, {})
+            if updates or options['once']:
+                self.stdout.write("{} updates of {} entities applied, {} pending, lag {:.1f} s".format(
+                    updates, entities, pending, lag
+                ))
+
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...documents import rebuild_search_documents
+from ...scopes import MODELS_BY_SCOPE
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the SearchDocument rows of every scope, or of the given ones, from the entity tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scopes', nargs='*', help="Any of: {}.".format(', '.join(sorted(MODELS_BY_SCOPE))))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        unexpected = [scope for scope in options['scopes'] if scope not in MODELS_BY_SCOPE]
+        if unexpected:
+            raise CommandError("Unexpected scope: {}".format(unexpected[0]))
+
+        started = time.time()
+        counts = rebuild_search_documents(options['scopes'], batch_size=options['batch_size'])
+        for scope, count in sorted(counts.items()):
+            self.stdout.write("{}: {} documents".format(scope, count))
+        self.stdout.write("Rebuilt in {:.0f} ms".format((time.time() - started) * 1000))
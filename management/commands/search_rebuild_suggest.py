@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...suggest import SuggestIndex, bump_generation
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the in-memory search suggestion index of every process on its next suggest request."
+
+    def handle(self, *args, **options):
+        generation = bump_generation()
+
+        started = time.time()
+        index = SuggestIndex.build(getattr(settings, 'SEARCH_SUGGEST_MAX_ENTRIES', 1000000))
+        self.stdout.write("Generation {}: {} keys, ~{:.1f} MB, built in {:.0f} ms{}".format(
+            generation,
+            index.size,
+            index.get_memory_size() / 1024.0 / 1024.0,
+            (time.time() - started) * 1000,
+            "" if index.complete else " (SEARCH_SUGGEST_MAX_ENTRIES exceeded, suggestions fall back to the database)"
+        ))
@@ -0,0 +1,65 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+QUERIES = (
+    ('prefix page', "SELECT id FROM search_benchmark WHERE UPPER(title::text) LIKE UPPER(%s) LIMIT 21", '{}%'),
+    ('prefix count', "SELECT COUNT(*) FROM search_benchmark WHERE UPPER(title::text) LIKE UPPER(%s)", '{}%'),
+    ('infix page', "SELECT id FROM search_benchmark WHERE UPPER(title::text) LIKE UPPER(%s) LIMIT 21", '%{}%'),
+    ('infix count', "SELECT COUNT(*) FROM search_benchmark WHERE UPPER(title::text) LIKE UPPER(%s)", '%{}%'),
+)
+
+
+class Command(BaseCommand):
+    help = "Times the search LIKE lookups on a scratch table with and without a pg_trgm GIN index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The trigram benchmark needs PostgreSQL.")
+
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                "CREATE TEMPORARY TABLE search_benchmark (id serial PRIMARY KEY, title varchar(255) NOT NULL)"
+            )
+            try:
+                cursor.execute(
+                    "INSERT INTO search_benchmark (title) "
+                    "SELECT initcap(md5(i::text)) || ' ' || md5((i * 7)::text) FROM generate_series(1, %s) AS i",
+                    [options['rows']]
+                )
+                cursor.execute("SELECT title FROM search_benchmark WHERE id = %s", [options['rows'] // 2 or 1])
+                title = cursor.fetchone()[0]
+                terms = {'{}%': title[:4], '%{}%': title[10:14]}
+
+                cursor.execute("ANALYZE search_benchmark")
+                without_index = self.run_queries(cursor, terms, options['repeat'])
+                cursor.execute("CREATE INDEX ON search_benchmark USING gin ((UPPER(title::text)) gin_trgm_ops)")
+                cursor.execute("ANALYZE search_benchmark")
+                with_index = self.run_queries(cursor, terms, options['repeat'])
+            finally:
+                cursor.execute("DROP TABLE IF EXISTS search_benchmark")
+
+        self.stdout.write("{} rows, median of {} runs".format(options['rows'], options['repeat']))
+        self.stdout.write("{:<14}{:>18}{:>18}".format("query", "no index, ms", "trigram, ms"))
+        for name, sql, pattern in QUERIES:
+            self.stdout.write("{:<14}{:>18.2f}{:>18.2f}".format(name, without_index[name], with_index[name]))
+
+    def run_queries(self, cursor, terms, repeat):
+        timings = {}
+        for name, sql, pattern in QUERIES:
+            term = pattern.format(terms[pattern])
+            durations = []
+            for i in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(sql, [term])
+                cursor.fetchall()
+                durations.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(durations)
+        return timings
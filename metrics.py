@@ -0,0 +1,210 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+
+
+class TrackedCursorWrapper(object):
+
+    def __init__(self, cursor, measurement):
+        self.cursor = cursor
+        self.measurement = measurement
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.cursor.__exit__(exc_type, exc_value, traceback)
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.measurement.add_query(time.perf_counter() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.perf_counter()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.measurement.add_query(time.perf_counter() - started)
+
+
+@contextmanager
+def track_queries(measurement, using=DEFAULT_DB_ALIAS):
+    """
+    Counts and times the statements run on this thread's connection by wrapping
+    the cursors it hands out; the SQL itself is never formatted or stored.
+    """
+    connection = connections[using]
+    names = ('make_cursor', 'make_debug_cursor')
+    originals = dict((name, connection.__dict__[name]) for name in names if name in connection.__dict__)
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TrackedCursorWrapper(make_cursor(cursor), measurement)
+    connection.make_debug_cursor = lambda cursor: TrackedCursorWrapper(make_debug_cursor(cursor), measurement)
+    try:
+        yield
+    finally:
+        for name in names:
+            if name in originals:
+                setattr(connection, name, originals[name])
+            else:
+                delattr(connection, name)
+
+
+class Measurement(object):
+
+    def __init__(self, scope, phase):
+        self.scope = scope
+        self.phase = phase
+        self.duration = 0.0
+        self.sql_count = 0
+        self.sql_duration = 0.0
+        self.rows = None
+        # Set when the phase turned out not to run, so that it is not recorded.
+        self.discarded = False
+
+    def add_query(self, duration):
+        self.sql_count += 1
+        self.sql_duration += duration
+
+
+class SearchMetrics(object):
+    """
+    Wall time, SQL count and time and row count of every phase of every scope
+    of one search request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.measurements = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, scope, phase):
+        measurement = Measurement(scope, phase)
+        started = time.perf_counter()
+        try:
+            with track_queries(measurement):
+                yield measurement
+        finally:
+            measurement.duration = time.perf_counter() - started
+            if not measurement.discarded:
+                with self.lock:
+                    self.measurements.append(measurement)
+
+    def get_totals(self):
+        totals = OrderedDict()
+        for measurement in sorted(self.measurements, key=lambda m: (m.scope, m.phase)):
+            total = totals.setdefault((measurement.scope, measurement.phase), Measurement(
+                measurement.scope, measurement.phase
+            ))
+            total.duration += measurement.duration
+            total.sql_count += measurement.sql_count
+            total.sql_duration += measurement.sql_duration
+            if measurement.rows is not None:
+                total.rows = (total.rows or 0) + measurement.rows
+        return list(totals.values())
+
+    def get_server_timing(self):
+        entries = []
+        for total in self.get_totals():
+            description = "{} sql, {:.1f} ms sql".format(total.sql_count, total.sql_duration * 1000)
+            if total.rows is not None:
+                description += ", {} rows".format(total.rows)
+            entries.append('{}-{};dur={:.1f};desc="{}"'.format(
+                total.scope, total.phase, total.duration * 1000, description
+            ))
+        entries.append('total;dur={:.1f}'.format((time.perf_counter() - self.started) * 1000))
+        return ', '.join(entries)
+
+    def emit(self, sink):
+        for total in self.get_totals():
+            tags = {'scope': total.scope, 'phase': total.phase}
+            sink.timing('search.phase.duration', total.duration * 1000, tags)
+            sink.increment('search.phase.sql_count', total.sql_count, tags)
+            sink.timing('search.phase.sql_duration', total.sql_duration * 1000, tags)
+            if total.rows is not None:
+                sink.increment('search.phase.rows', total.rows, tags)
+        sink.timing('search.request.duration', (time.perf_counter() - self.started) * 1000, {})
+
+
+class NullMetrics(object):
+
+    @contextmanager
+    def measure(self, scope, phase):
+        yield Measurement(scope, phase)
+
+
+class InMemoryMetricsSink(object):
+    """Keeps everything it is sent; meant for tests and the Django shell."""
+
+    def __init__(self):
+        self.timings = []
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def timing(self, name, value, tags):
+        with self.lock:
+            self.timings.append((name, value, tags))
+
+    def increment(self, name, value, tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+class StatsdMetricsSink(object):
+    """Sends DogStatsD-style tagged metrics over UDP without waiting for a reply."""
+
+    def __init__(self, host=None, port=None, prefix=None):
+        self.address = (
+            host or getattr(settings, 'SEARCH_STATSD_HOST', 'localhost'),
+            port or getattr(settings, 'SEARCH_STATSD_PORT', 8125)
+        )
+        self.prefix = prefix if prefix is not None else getattr(settings, 'SEARCH_STATSD_PREFIX', '')
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name, value, metric_type, tags):
+        line = '{}{}:{}|{}'.format(self.prefix, name, value, metric_type)
+        if tags:
+            line += '|#' + ','.join('{}:{}'.format(key, tag) for key, tag in sorted(tags.items()))
+        try:
+            self.socket.sendto(line.encode(), self.address)
+        except socket.error:
+            pass
+
+    def timing(self, name, value, tags):
+        self.send(name, '{:.3f}'.format(value), 'ms', tags)
+
+    def increment(self, name, value, tags):
+        self.send(name, value, 'c', tags)
+
+
+_sink = None
+_sink_setting = None
+_sink_lock = threading.Lock()
+
+
+def get_metrics_sink():
+    """Returns an instance of the SEARCH_METRICS_SINK class, or None when it is not set."""
+    global _sink, _sink_setting
+    setting = getattr(settings, 'SEARCH_METRICS_SINK', None)
+    with _sink_lock:
+        if setting != _sink_setting:
+            sink_class = import_string(setting) if isinstance(setting, str) else setting
+            _sink = sink_class() if sink_class else None
+            _sink_setting = setting
+        return _sink
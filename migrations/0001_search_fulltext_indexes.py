@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # The GIN indexes PostgresFullTextBackend reads are only built by the
+    # search_fulltext_indexes command, so that every other backend is spared
+    # their write cost; this migration only orders the search app after the
+    # models it indexes.
+
+    dependencies = [
+        ('userprofile', '0001_initial'),
+        ('communities', '0001_initial'),
+        ('galleries', '0001_initial'),
+        ('posts', '0001_initial'),
+    ]
+
+    operations = []
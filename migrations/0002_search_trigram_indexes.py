@@ -0,0 +1,57 @@
+from django.apps import apps as global_apps
+from django.db import migrations
+
+INDEXED_FIELDS = (
+    ('userprofile', 'UserProfile', 'first_name'),
+    ('userprofile', 'UserProfile', 'last_name'),
+    ('communities', 'Community', 'name'),
+    ('galleries', 'VideoItem', 'title'),
+    ('galleries', 'AudioItem', 'title'),
+    ('galleries', 'TextItem', 'title'),
+    ('posts', 'Post', 'title'),
+)
+
+
+def get_index_name(model, field_name):
+    return 'search_trgm_{}_{}'.format(model._meta.db_table, field_name)[:63]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for app_label, model_name, field_name in INDEXED_FIELDS:
+        model = apps.get_model(app_label, model_name)
+        # Django compiles istartswith/icontains on PostgreSQL to
+        # UPPER("column"::text) LIKE UPPER(%s), so the index is built on that expression.
+        schema_editor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS \"{}\" ON \"{}\" "
+            "USING gin ((UPPER(\"{}\"::text)) gin_trgm_ops)".format(
+                get_index_name(model, field_name), model._meta.db_table, model._meta.get_field(field_name).column
+            )
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for app_label, model_name, field_name in INDEXED_FIELDS:
+        schema_editor.execute(
+            "DROP INDEX CONCURRENTLY IF EXISTS \"{}\"".format(
+                get_index_name(apps.get_model(app_label, model_name), field_name)
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        (global_apps.get_containing_app_config(__name__).label, '0001_search_fulltext_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,53 @@
+from django.apps import apps as global_apps
+from django.db import migrations, models
+
+TEXT_INDEX_NAME = 'search_trgm_searchdocument_text'
+
+
+def create_text_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model(global_apps.get_containing_app_config(__name__).label, 'SearchDocument')
+    # The text is stored normalized, so matches are plain LIKE 'name%' and
+    # LIKE '% name%' that a trigram index on the bare column can serve.
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS \"{}\" ON \"{}\" USING gin (\"text\" gin_trgm_ops)".format(
+            TEXT_INDEX_NAME, model._meta.db_table
+        )
+    )
+
+
+def drop_text_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS \"{}\"".format(TEXT_INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (global_apps.get_containing_app_config(__name__).label, '0002_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('is_visible', models.BooleanField(default=True)),
+                ('date_created', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together=set([('scope', 'object_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchdocument',
+            index_together=set([('scope', 'is_visible', 'date_created', 'object_id')]),
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
@@ -0,0 +1,21 @@
+from django.apps import apps as global_apps
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (global_apps.get_containing_app_config(__name__).label, '0003_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocumentUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('date_queued', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
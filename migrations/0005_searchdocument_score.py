@@ -0,0 +1,29 @@
+from django.apps import apps as global_apps
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (global_apps.get_containing_app_config(__name__).label, '0004_searchdocumentupdate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchdocument',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='searchdocument',
+            name='score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchdocument',
+            index_together=set([
+                ('scope', 'is_visible', 'date_created', 'object_id'),
+                ('scope', 'is_visible', 'score', 'object_id'),
+            ]),
+        ),
+    ]
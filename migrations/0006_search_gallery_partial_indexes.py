@@ -0,0 +1,54 @@
+from django.apps import apps as global_apps
+from django.db import migrations
+
+GALLERY_MODELS = (
+    ('galleries', 'VideoItem'),
+    ('galleries', 'AudioItem'),
+    ('galleries', 'TextItem'),
+)
+
+
+def get_index_name(model):
+    return 'search_submitted_{}'.format(model._meta.db_table)[:63]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for app_label, model_name in GALLERY_MODELS:
+        model = apps.get_model(app_label, model_name)
+        # Only submitted items are ever visible, so the rows of unfinished
+        # uploads are kept out of the index the gallery pages are read from.
+        schema_editor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS \"{}\" ON \"{}\" (\"{}\" DESC, \"{}\") WHERE \"{}\"".format(
+                get_index_name(model),
+                model._meta.db_table,
+                model._meta.get_field('date_created').column,
+                model._meta.pk.column,
+                model._meta.get_field('submitted').column
+            )
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for app_label, model_name in GALLERY_MODELS:
+        schema_editor.execute(
+            "DROP INDEX CONCURRENTLY IF EXISTS \"{}\"".format(get_index_name(apps.get_model(app_label, model_name)))
+        )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        (global_apps.get_containing_app_config(__name__).label, '0005_searchdocument_score'),
+        ('galleries', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
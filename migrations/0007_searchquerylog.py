@@ -0,0 +1,26 @@
+import django.utils.timezone
+from django.apps import apps as global_apps
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (global_apps.get_containing_app_config(__name__).label, '0006_search_gallery_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQueryLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('scope', models.CharField(blank=True, max_length=16)),
+                ('scope_2', models.CharField(blank=True, max_length=16)),
+                ('duration', models.FloatField()),
+                ('result_count', models.PositiveIntegerField()),
+                ('cache_hit', models.NullBooleanField()),
+                ('date_created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,96 @@
+from django.db import models
+from django.utils import timezone
+
+from .query import normalize, tokenize
+
+
+class SearchDocumentQuerySet(models.QuerySet):
+
+    def visible(self):
+        return self.filter(is_visible=True)
+
+    def matching(self, name):
+        """
+        Documents with a word starting with every token of `name`, in any
+        order; each token is a lookup the trigram index on text can serve.
+        """
+        queryset = self
+        for token in tokenize(name, casefold=False):
+            queryset = queryset.filter(models.Q(text__startswith=token) | models.Q(text__contains=' {}'.format(token)))
+        return queryset
+
+    def with_match_tier(self, name):
+        """
+        Annotates match_tier: 0 when the text is `name` itself, 1 when it
+        starts with it and 2 otherwise.
+        """
+        name = normalize(name, casefold=False)
+        return self.annotate(match_tier=models.Case(
+            models.When(text=name, then=models.Value(0)),
+            models.When(text__startswith=name, then=models.Value(1)),
+            default=models.Value(2),
+            output_field=models.IntegerField()
+        ))
+
+
+class SearchDocument(models.Model):
+    """
+    One row per searchable entity of every scope, kept in sync by the search
+    signals and rebuilt with the search_rebuild_documents command.
+    """
+
+    scope = models.CharField(max_length=16)
+    object_id = models.PositiveIntegerField()
+    text = models.TextField()
+    is_visible = models.BooleanField(default=True)
+    date_created = models.DateTimeField(null=True)
+    popularity = models.FloatField(default=0)
+    # Recency and popularity folded into one precomputed, indexed sort key;
+    # see get_score() in documents.py.
+    score = models.FloatField(default=0)
+
+    objects = SearchDocumentQuerySet.as_manager()
+
+    class Meta:
+        unique_together = (('scope', 'object_id'),)
+        index_together = (
+            ('scope', 'is_visible', 'date_created', 'object_id'),
+            ('scope', 'is_visible', 'score', 'object_id'),
+        )
+
+    def __str__(self):
+        return '{} {}: {}'.format(self.scope, self.object_id, self.text)
+
+
+class SearchDocumentUpdate(models.Model):
+    """
+    A queued change to an entity whose SearchDocument is out of date; see
+    the search_process_document_updates command.
+    """
+
+    scope = models.CharField(max_length=16)
+    object_id = models.PositiveIntegerField()
+    date_queued = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.scope, self.object_id)
+
+
+class SearchQueryLog(models.Model):
+    """
+    A sampled search request, written in bulk by querylog.flush_query_log();
+    see the search_hot_queries command.
+    """
+
+    name = models.CharField(max_length=255)
+    scope = models.CharField(max_length=16, blank=True)
+    scope_2 = models.CharField(max_length=16, blank=True)
+    # Milliseconds.
+    duration = models.FloatField()
+    result_count = models.PositiveIntegerField()
+    # None when the result cache was not used.
+    cache_hit = models.NullBooleanField()
+    date_created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return '{} {} {}: {}'.format(self.date_created, self.scope or 'all', self.scope_2, self.name)
@@ -0,0 +1,99 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+from apps.api.exceptions import BadRequest
+
+
+class CursorEncoder(json.JSONEncoder):
+
+    def default(self, o):
+        # Unlike DjangoJSONEncoder, keep the microseconds: a truncated
+        # timestamp would skip or repeat rows at the page boundary.
+        if hasattr(o, 'isoformat'):
+            return o.isoformat()
+        return str(o)
+
+
+class KeysetPaginator(object):
+    """
+    Pages a queryset by the values of its ordering fields instead of an offset,
+    so every page costs the same index range scan as the first one.
+
+    The ordering must end with a unique field (usually 'pk') to be stable.
+    """
+
+    default_limit = 20
+    max_limit = 100
+
+    def __init__(self, ordering, limit=None, cursor=None):
+        self.ordering = tuple(ordering)
+        self.limit = self.parse_limit(limit)
+        self.cursor = cursor or None
+
+    def parse_limit(self, limit):
+        if limit in (None, ''):
+            return self.default_limit
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise BadRequest("Invalid limit: {}".format(limit))
+        if not 0 < limit <= self.max_limit:
+            raise BadRequest("Limit must be between 1 and {}".format(self.max_limit))
+        return limit
+
+    def get_field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, row):
+        values = [getattr(row, name) for name in self.get_field_names()]
+        return base64.urlsafe_b64encode(json.dumps(values, cls=CursorEncoder).encode()).decode()
+
+    def decode_cursor(self, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(self.cursor.encode()).decode())
+        except (TypeError, ValueError, binascii.Error):
+            raise BadRequest("Invalid cursor")
+        names = self.get_field_names()
+        if not isinstance(values, list) or len(values) != len(names):
+            raise BadRequest("Invalid cursor")
+        try:
+            return [self.to_python(model, name, value) for name, value in zip(names, values)]
+        except ValidationError:
+            raise BadRequest("Invalid cursor")
+
+    def to_python(self, model, name, value):
+        if name == 'pk':
+            return model._meta.pk.to_python(value)
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations are compared as they came out of the cursor.
+            return value
+        return field.to_python(value)
+
+    def get_position_filter(self, values):
+        position = Q()
+        for index, field in enumerate(self.ordering):
+            lookups = dict(zip(self.get_field_names()[:index], values[:index]))
+            lookups['{}__{}'.format(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt')] = values[index]
+            position |= Q(**lookups)
+        return position
+
+    def paginate_queryset(self, queryset):
+        """
+        Returns the rows of the requested page and the cursor of the next one,
+        or None when there are no more rows.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(self.decode_cursor(queryset.model)))
+
+        rows = list(queryset[:self.limit + 1])
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            return rows, self.encode_cursor(rows[-1])
+        return rows, None
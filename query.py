@@ -0,0 +1,87 @@
+import re
+import unicodedata
+
+from django.conf import settings
+
+from apps.api.exceptions import BadRequest
+
+# Lowercase Cyrillic letters that render like a Latin one, and back.
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'е': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'у': 'y', 'х': 'x', 'к': 'k', 'і': 'i', 'ј': 'j',
+    'ѕ': 's', 'һ': 'h', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w', 'ӏ': 'l',
+}
+LATIN_TO_CYRILLIC = dict((latin, cyrillic) for cyrillic, latin in CYRILLIC_TO_LATIN.items())
+
+
+def get_script(char):
+    if not char.isalpha():
+        return None
+    name = unicodedata.name(char, '')
+    if name.startswith('LATIN'):
+        return 'latin'
+    if name.startswith('CYRILLIC'):
+        return 'cyrillic'
+    return None
+
+
+def fold_homoglyphs(word):
+    """
+    Spells a word that mixes Latin and Cyrillic letters in the script most
+    of its letters (or, on a tie, its first letter) are in, as far as the
+    letters look alike.
+    """
+    scripts = [script for script in map(get_script, word) if script]
+    latin, cyrillic = scripts.count('latin'), scripts.count('cyrillic')
+    if not latin or not cyrillic:
+        return word
+    to_latin = latin > cyrillic or (latin == cyrillic and scripts[0] == 'latin')
+    homoglyphs = CYRILLIC_TO_LATIN if to_latin else LATIN_TO_CYRILLIC
+    return ''.join(homoglyphs.get(char, char) for char in word)
+
+
+def normalize(text, casefold=True):
+    """
+    NFKC, casefolded, whitespace collapsed and mixed-script words folded to
+    a single script. Suggestion and snapshot keys and the queries compared
+    with them go through it, so they compare equal whatever form the input
+    came in.
+
+    Text compared in the database, search documents and ORM lookups alike,
+    is only lowercased (casefold=False) instead: LOWER() and the i-lookups
+    do not casefold, so "Straße" has to reach them as "straße".
+    """
+    text = unicodedata.normalize('NFKC', text or '')
+    text = text.casefold() if casefold else text.lower()
+    return ' '.join(re.sub(r'\w+', lambda match: fold_homoglyphs(match.group()), text).split())
+
+
+def tokenize(text, casefold=True):
+    return normalize(text, casefold).split()
+
+
+class SearchQuery(object):
+
+    def __init__(self, text):
+        # What the search backends are given; they casefold it themselves
+        # where they compare it in Python.
+        self.text = normalize(text, casefold=False)
+        self.tokens = tuple(self.text.split())
+
+    def __str__(self):
+        return self.text
+
+
+def parse_query(name, min_length=None):
+    """
+    Returns the SearchQuery of `name`, rejecting empty queries and ones
+    shorter than min_length (by default SEARCH_MIN_QUERY_LENGTH) once
+    normalized.
+    """
+    query = SearchQuery(name)
+    if not query.text:
+        raise BadRequest("Empty name")
+    if min_length is None:
+        min_length = getattr(settings, 'SEARCH_MIN_QUERY_LENGTH', 2)
+    if len(query.text) < min_length:
+        raise BadRequest("Name must be at least {} characters long".format(min_length))
+    return query
@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db.models import Avg, Case, Count, IntegerField, When
+
+from .models import SearchQueryLog
+
+
+class QueryLogBuffer(object):
+    """
+    A ring buffer of SearchQueryLog rows waiting to be written. Once
+    max_entries is reached the oldest rows make room for new ones, so a slow
+    or failing flush costs log entries rather than memory.
+    """
+
+    def __init__(self, max_entries):
+        self.entries = deque(maxlen=max_entries)
+        self.lock = threading.Lock()
+        self.flushed = time.time()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def drain(self):
+        with self.lock:
+            entries = list(self.entries)
+            self.entries.clear()
+            self.flushed = time.time()
+        return entries
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_query_log_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = QueryLogBuffer(getattr(settings, 'SEARCH_QUERY_LOG_MAX_ENTRIES', 10000))
+        return _buffer
+
+
+def should_log_query():
+    """Samples SEARCH_QUERY_LOG_SAMPLE_RATE of the searches; the log is off by default."""
+    rate = getattr(settings, 'SEARCH_QUERY_LOG_SAMPLE_RATE', 0)
+    return bool(rate) and random.random() < rate
+
+
+def log_query(**fields):
+    """
+    Buffers a SearchQueryLog of the given fields, flushing the buffer once it
+    holds SEARCH_QUERY_LOG_FLUSH_SIZE rows or SEARCH_QUERY_LOG_FLUSH_INTERVAL
+    seconds have passed since the last flush.
+    """
+    buffer = get_query_log_buffer()
+    buffer.append(SearchQueryLog(**fields))
+    if (
+        len(buffer) >= getattr(settings, 'SEARCH_QUERY_LOG_FLUSH_SIZE', 100) or
+        time.time() - buffer.flushed >= getattr(settings, 'SEARCH_QUERY_LOG_FLUSH_INTERVAL', 60)
+    ):
+        flush_query_log()
+
+
+def flush_query_log():
+    entries = get_query_log_buffer().drain()
+    if entries:
+        SearchQueryLog.objects.bulk_create(entries)
+    return len(entries)
+
+
+def get_hot_queries(limit=20, since=None):
+    """
+    The `limit` most frequent name, scope and scope_2 combinations logged
+    since `since`, with their hits, average duration and result count and
+    the number of them answered from the result cache.
+    """
+    queryset = SearchQueryLog.objects.all()
+    if since is not None:
+        queryset = queryset.filter(date_created__gte=since)
+    return list(queryset.values('name', 'scope', 'scope_2').annotate(
+        hits=Count('pk'),
+        avg_duration=Avg('duration'),
+        avg_result_count=Avg('result_count'),
+        cache_hits=Count(Case(When(cache_hit=True, then=1), output_field=IntegerField()))
+    ).order_by('-hits', 'name', 'scope', 'scope_2')[:limit])
@@ -0,0 +1,51 @@
+from apps.communities.models import Community
+from apps.galleries.models import VideoItem, AudioItem, TextItem
+from apps.posts.models import Post
+from apps.userprofile.models import UserProfile
+
+MODELS_BY_SCOPE = {
+    'profiles': UserProfile,
+    'communities': Community,
+    'video': VideoItem,
+    'audio': AudioItem,
+    'text': TextItem,
+    'posts': Post,
+}
+
+SCOPES_BY_MODEL = dict((model, scope) for scope, model in MODELS_BY_SCOPE.items())
+
+# Scopes of the gallery item models, which share their visibility rules.
+GALLERY_SCOPES = ('video', 'audio', 'text')
+
+SEARCH_FIELDS_BY_SCOPE = {
+    'profiles': ('first_name', 'last_name'),
+    'communities': ('name',),
+    'video': ('title',),
+    'audio': ('title',),
+    'text': ('title',),
+    'posts': ('title',),
+}
+
+# The order results of every scope are listed in, before any ranking a search
+# backend puts in front of it.
+ORDERING_BY_SCOPE = {
+    'profiles': ('pk',),
+    'communities': ('pk',),
+    'video': ('-date_created', 'pk'),
+    'audio': ('-date_created', 'pk'),
+    'text': ('-date_created', 'pk'),
+    'posts': ('-date_created', 'pk'),
+}
+
+
+def get_label(values):
+    return ' '.join(value for value in values if value)
+
+
+def get_visible_queryset(scope):
+    model = MODELS_BY_SCOPE[scope]
+    if scope == 'profiles':
+        return model.objects.all()
+    if scope in GALLERY_SCOPES:
+        return model.objects.visible_to_all()
+    return model.objects.not_deleted()
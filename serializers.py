@@ -0,0 +1,10 @@
+from apps.userprofile.api.serializers import UserProfileRelationsBriefSerializer
+
+
+class SearchProfileSerializer(UserProfileRelationsBriefSerializer):
+
+    def get_status(self, obj):
+        social_graph = self.context.get('social_graph')
+        if social_graph is None:
+            return super(SearchProfileSerializer, self).get_status(obj)
+        return social_graph.get_status(obj.user_id)
@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from apps.userprofile.models import UserProfile
+
+from .backends import SearchDocumentBackend, get_search_backend
+from .cache import bump_version
+from .documents import enqueue_search_document_updates, replace_search_documents
+from .scopes import GALLERY_SCOPES, MODELS_BY_SCOPE, SCOPES_BY_MODEL
+from .suggest import refresh_suggest_index, remove_from_suggest_index, update_suggest_index
+
+
+def search_documents_enabled():
+    """
+    SearchDocuments are only maintained while SEARCH_DOCUMENTS is on, which by
+    default it is exactly when SearchDocumentBackend is the search backend.
+    """
+    enabled = getattr(settings, 'SEARCH_DOCUMENTS', None)
+    if enabled is None:
+        return isinstance(get_search_backend(), SearchDocumentBackend)
+    return enabled
+
+
+def search_documents_changed(scope, pks):
+    if not search_documents_enabled():
+        return
+    # Writes only queue the change unless SEARCH_QUEUE_DOCUMENT_UPDATES is off.
+    if getattr(settings, 'SEARCH_QUEUE_DOCUMENT_UPDATES', True):
+        enqueue_search_document_updates(scope, pks)
+    else:
+        replace_search_documents(scope, pks)
+
+
+def get_gallery_model(scope):
+    return MODELS_BY_SCOPE[scope]._meta.get_field('gallery').related_model
+
+
+def get_attached_items(scope, instance):
+    """The gallery items of a scope in the gallery, or attached to the profile or community, `instance`."""
+    model = MODELS_BY_SCOPE[scope]
+    if isinstance(instance, get_gallery_model(scope)):
+        return model.objects.filter(gallery=instance)
+    for field in model._meta.private_fields:
+        if isinstance(field, GenericForeignKey):
+            return model.objects.filter(**{
+                field.ct_field: ContentType.objects.get_for_model(instance), field.fk_field: instance.pk
+            })
+    return model.objects.none()
+
+
+def attached_items_changed(instance, scopes):
+    # Gallery items are visible depending on their gallery and the object they
+    # are attached to, neither of which saves the items themselves, so their
+    # scope versions, suggestions and documents are brought up to date here.
+    for scope in scopes:
+        pks = list(get_attached_items(scope, instance).values_list('pk', flat=True))
+        if not pks:
+            continue
+        bump_version('scope:{}'.format(scope))
+        refresh_suggest_index(scope, pks)
+        search_documents_changed(scope, pks)
+
+
+def search_item_saved(sender, instance, **kwargs):
+    scope = SCOPES_BY_MODEL[sender]
+    bump_version('scope:{}'.format(scope))
+    search_documents_changed(scope, [instance.pk])
+    update_suggest_index(scope, instance)
+    if scope in ('profiles', 'communities'):
+        attached_items_changed(instance, GALLERY_SCOPES)
+
+
+def search_item_deleted(sender, instance, **kwargs):
+    scope = SCOPES_BY_MODEL[sender]
+    bump_version('scope:{}'.format(scope))
+    search_documents_changed(scope, [instance.pk])
+    remove_from_suggest_index(scope, instance)
+    if scope in ('profiles', 'communities'):
+        attached_items_changed(instance, GALLERY_SCOPES)
+
+
+def gallery_changed(sender, instance, **kwargs):
+    attached_items_changed(instance, [scope for scope in GALLERY_SCOPES if get_gallery_model(scope) is sender])
+
+
+def relationship_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        user_ids = {instance.pk}
+        user_ids.update(UserProfile.objects.filter(pk__in=pk_set or ()).values_list('user_id', flat=True))
+    else:
+        user_ids = {instance.user_id}
+        user_ids.update(pk_set or ())
+    for user_id in user_ids:
+        bump_version('user:{}'.format(user_id))
+    if sender is UserProfile.followed.through and search_documents_enabled():
+        # Follower counts are the popularity of profile search documents.
+        search_documents_changed(
+            'profiles', list(UserProfile.objects.filter(user__in=user_ids).values_list('pk', flat=True))
+        )
+
+
+def friendship_request_changed(sender, instance, **kwargs):
+    # Requests are part of the profile statuses of both users.
+    bump_version('user:{}'.format(instance.from_user_id))
+    bump_version('user:{}'.format(instance.to_user_id))
+
+
+for scope, model in MODELS_BY_SCOPE.items():
+    post_save.connect(search_item_saved, sender=model, dispatch_uid='search_item_saved_{}'.format(scope))
+    post_delete.connect(search_item_deleted, sender=model, dispatch_uid='search_item_deleted_{}'.format(scope))
+
+for gallery_model in set(get_gallery_model(scope) for scope in GALLERY_SCOPES):
+    label = gallery_model._meta.label_lower
+    post_save.connect(gallery_changed, sender=gallery_model, dispatch_uid='search_gallery_saved_{}'.format(label))
+    post_delete.connect(gallery_changed, sender=gallery_model, dispatch_uid='search_gallery_deleted_{}'.format(label))
+
+for relation in ('friends', 'followed', 'blocked'):
+    m2m_changed.connect(
+        relationship_changed,
+        sender=getattr(UserProfile, relation).through,
+        dispatch_uid='search_relationship_changed_{}'.format(relation)
+    )
+
+friendship_request_model = get_user_model()._meta.get_field('friendship_requests_sent').related_model
+post_save.connect(
+    friendship_request_changed, sender=friendship_request_model, dispatch_uid='search_friendship_request_saved'
+)
+post_delete.connect(
+    friendship_request_changed, sender=friendship_request_model, dispatch_uid='search_friendship_request_deleted'
+)
@@ -0,0 +1,196 @@
+import bisect
+import sys
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import get_versions
+from .documents import EPOCH, get_date_field
+from .executors import run_in_background
+from .query import normalize
+from .scopes import ORDERING_BY_SCOPE, SEARCH_FIELDS_BY_SCOPE, get_label, get_visible_queryset
+
+# Scopes whose visible rows are the same for every viewer.
+SNAPSHOT_SCOPES = ('communities', 'video', 'audio', 'text', 'posts')
+
+MATCHES = ('prefix', 'infix')
+
+
+def to_microseconds(value):
+    if value is None:
+        return 0
+    epoch = EPOCH if timezone.is_aware(value) else timezone.make_naive(EPOCH, timezone.utc)
+    return (value - epoch) // timedelta(microseconds=1)
+
+
+class ScopeSnapshot(object):
+    """
+    The visible rows of one scope in result order, stored column by column:
+    primary keys and creation times (microseconds since the epoch, sorted
+    newest first for the scopes listed that way) in int64 arrays, and the
+    normalized titles interned and joined by newlines into one string, with
+    the offset each title starts at.
+
+    A prefix search is a bisect of the titles sorted on their own, an infix
+    search a str.find() scan of the joined ones; both run in C over the
+    whole column, and the positions they return are in result order.
+    """
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        self.dates = array('q')
+        self.offsets = array('q')
+        titles = []
+        offset = 0
+        for pk, date_created, title in rows:
+            title = sys.intern(title)
+            self.ids.append(pk)
+            self.dates.append(to_microseconds(date_created))
+            self.offsets.append(offset)
+            titles.append(title)
+            offset += len(title) + 1
+        self.text = '\n'.join(titles)
+        order = sorted(range(len(titles)), key=titles.__getitem__)
+        self.sorted_titles = [titles[position] for position in order]
+        self.sorted_positions = array('q', order)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def match_prefix(self, name):
+        start = bisect.bisect_left(self.sorted_titles, name)
+        end = bisect.bisect_left(self.sorted_titles, name + chr(sys.maxunicode), start)
+        return sorted(self.sorted_positions[start:end])
+
+    def match_infix(self, name):
+        positions = []
+        find, offsets = self.text.find, self.offsets
+        index = find(name)
+        while index != -1:
+            position = bisect.bisect_right(offsets, index) - 1
+            positions.append(position)
+            if position + 1 == len(offsets):
+                break
+            # On to the next title, so that each one is reported once.
+            index = find(name, offsets[position + 1])
+        return positions
+
+    def search(self, name, match='prefix'):
+        """The positions of the rows whose title starts with, or contains, `name`."""
+        name = normalize(name)
+        if not name:
+            return []
+        return self.match_prefix(name) if match == 'prefix' else self.match_infix(name)
+
+    def get_sort_key(self, position, ordering):
+        key = []
+        for field in ordering:
+            value = self.ids[position] if field.lstrip('-') == 'pk' else self.dates[position]
+            key.append(-value if field.startswith('-') else value)
+        return tuple(key)
+
+    def skip_past(self, positions, ordering, values):
+        """
+        The positions, in result order, that come after a row with the given
+        values of the ordering fields, which may be pk and date_created.
+        """
+        cursor = tuple(
+            (-1 if field.startswith('-') else 1) * (value if field.lstrip('-') == 'pk' else to_microseconds(value))
+            for field, value in zip(ordering, values)
+        )
+        low, high = 0, len(positions)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_sort_key(positions[middle], ordering) <= cursor:
+                low = middle + 1
+            else:
+                high = middle
+        return positions[low:]
+
+    def get_ids(self, positions):
+        return [self.ids[position] for position in positions]
+
+    def get_memory_size(self):
+        size = sum(sys.getsizeof(column) for column in (
+            self.ids, self.dates, self.offsets, self.text, self.sorted_titles, self.sorted_positions
+        ))
+        return size + sum(sys.getsizeof(title) for title in self.sorted_titles)
+
+
+class SearchSnapshot(object):
+    """
+    The ScopeSnapshots of the SNAPSHOT_SCOPES of this process. Each one is
+    rebuilt on its own, in the background, once the data version of its scope
+    has moved on (at most every SEARCH_SNAPSHOT_MAX_STALENESS seconds, five
+    minutes by default, since every rebuild is a scan of the whole scope) and
+    every SEARCH_SNAPSHOT_REBUILD_INTERVAL seconds regardless; searches keep
+    using the previous one until the new one is swapped in. Hits are checked
+    for visibility when they are loaded, so rows deleted or hidden since do
+    not show up, while new rows wait for the next rebuild.
+
+    Scopes of more than SEARCH_SNAPSHOT_MAX_ROWS visible rows are not kept,
+    and neither are scopes whose first snapshot is still being built, so
+    callers can fall back to the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # scope -> (ScopeSnapshot or None, data version, time built)
+        self.entries = {}
+
+    def build_scope(self, scope):
+        max_rows = getattr(settings, 'SEARCH_SNAPSHOT_MAX_ROWS', 1000000)
+        date_field = get_date_field(scope)
+        columns = ('pk',) + ((date_field,) if date_field else ()) + SEARCH_FIELDS_BY_SCOPE[scope]
+        queryset = get_visible_queryset(scope).order_by(*ORDERING_BY_SCOPE[scope]).values_list(*columns)
+        start = 2 if date_field else 1
+        snapshot = ScopeSnapshot(
+            (row[0], row[1] if date_field else None, normalize(get_label(row[start:])))
+            for row in queryset[:max_rows + 1].iterator()
+        )
+        return snapshot if len(snapshot) <= max_rows else None
+
+    def rebuild_scope(self, scope, version):
+        # The version was read before the rows, so a write made during the
+        # build is picked up by the next one.
+        snapshot = self.build_scope(scope)
+        with self.lock:
+            self.entries[scope] = (snapshot, version, time.time())
+
+    def get(self, scopes):
+        """A dict of the ScopeSnapshot of every scope of `scopes`, or None for the ones not kept."""
+        versions = get_versions(['scope:{}'.format(scope) for scope in scopes])
+        interval = getattr(settings, 'SEARCH_SNAPSHOT_REBUILD_INTERVAL', 3600)
+        max_staleness = getattr(settings, 'SEARCH_SNAPSHOT_MAX_STALENESS', 300)
+        snapshots = {}
+        for scope in scopes:
+            version = versions['scope:{}'.format(scope)]
+            with self.lock:
+                entry = self.entries.get(scope)
+            age = time.time() - entry[2] if entry is not None else None
+            if entry is None or age > interval or (entry[1] != version and age >= max_staleness):
+                run_in_background('snapshot:{}'.format(scope), self.rebuild_scope, scope, version)
+                with self.lock:
+                    entry = self.entries.get(scope)
+            snapshots[scope] = entry[0] if entry is not None else None
+        return snapshots
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_search_snapshot():
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = SearchSnapshot()
+        return _snapshot
@@ -0,0 +1,82 @@
+from django.utils.functional import cached_property
+
+
+class SocialGraph(object):
+    """
+    The requesting user's relationships as sets of user IDs. Each set is
+    resolved with a single query the first time it is used and then shared
+    for the rest of the request; scope_2 filters need them whole.
+
+    The status of the users of a result page only needs their own rows, so
+    load_statuses() resolves it with one query per relationship restricted
+    to their IDs instead. Only the statuses of the last page or streamed
+    batch are kept.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.profile = user.userprofile
+        self.statuses = {}
+
+    @cached_property
+    def friend_ids(self):
+        return frozenset(self.profile.friends.values_list('pk', flat=True))
+
+    @cached_property
+    def followed_ids(self):
+        return frozenset(self.profile.followed.values_list('pk', flat=True))
+
+    @cached_property
+    def follower_ids(self):
+        return frozenset(self.user.followers.values_list('user_id', flat=True))
+
+    @cached_property
+    def blocked_ids(self):
+        return frozenset(self.profile.blocked.values_list('pk', flat=True))
+
+    @cached_property
+    def inbox_request_ids(self):
+        return frozenset(self.user.friendship_requests_received.values_list('from_user_id', flat=True))
+
+    @cached_property
+    def outbox_request_ids(self):
+        return frozenset(self.user.friendship_requests_sent.values_list('to_user_id', flat=True))
+
+    def get_statuses(self, user_ids):
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+        friend_ids = set(self.profile.friends.filter(pk__in=user_ids).values_list('pk', flat=True))
+        follower_ids = set(self.user.followers.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        followed_ids = set(self.profile.followed.filter(pk__in=user_ids).values_list('pk', flat=True))
+        blocked_ids = set(self.profile.blocked.filter(pk__in=user_ids).values_list('pk', flat=True))
+        inbox_request_ids = set(self.user.friendship_requests_received.filter(
+            from_user_id__in=user_ids
+        ).values_list('from_user_id', flat=True))
+        outbox_request_ids = set(self.user.friendship_requests_sent.filter(
+            to_user_id__in=user_ids
+        ).values_list('to_user_id', flat=True))
+        statuses = {}
+        for user_id in user_ids:
+            status = {
+                'is_friend': user_id in friend_ids,
+                'is_follower': user_id in follower_ids,
+            }
+            if status['is_follower']:
+                status['friendship_request_sent'] = user_id in outbox_request_ids
+            status.update({
+                'is_followed': user_id in followed_ids,
+                'is_blocked': user_id in blocked_ids,
+                'is_inbox_request': user_id in inbox_request_ids,
+                'is_outbox_request': user_id in outbox_request_ids
+            })
+            statuses[user_id] = status
+        return statuses
+
+    def load_statuses(self, user_ids):
+        self.statuses = self.get_statuses(user_ids)
+
+    def get_status(self, user_id):
+        if user_id not in self.statuses:
+            return self.get_statuses([user_id])[user_id]
+        return dict(self.statuses[user_id])
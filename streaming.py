@@ -0,0 +1,50 @@
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+ITERATOR_CHUNK_SIZE = 500
+
+
+def iterate_queryset(queryset, chunk_size=ITERATOR_CHUNK_SIZE):
+    try:
+        return queryset.iterator(chunk_size=chunk_size)
+    except TypeError:
+        # Django < 2.0 has no chunk_size; iterator() still streams from a server-side cursor.
+        return queryset.iterator()
+
+
+def prefetch_batches(rows, prefetch, batch_size=ITERATOR_CHUNK_SIZE):
+    """Yields the rows, calling prefetch() with every batch of them before it is yielded."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            prefetch(batch)
+            yield from batch
+            batch = []
+    if batch:
+        prefetch(batch)
+        yield from batch
+
+
+def dumps(value):
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def stream_sections(sections):
+    """
+    Yields a JSON object one row at a time. Every section is a tuple of the
+    items key, the count key, the next cursor key, an iterable of rows and
+    the function that turns a row into its representation; the count is
+    written after the items, once they have all been seen.
+    """
+    separator = '{'
+    for items_key, count_key, next_cursor_key, rows, to_representation in sections:
+        yield '{}{}:['.format(separator, dumps(items_key))
+        count = 0
+        for row in rows:
+            yield '{}{}'.format(',' if count else '', dumps(to_representation(row)))
+            count += 1
+        yield '],{}:{},{}:null'.format(dumps(count_key), count, dumps(next_cursor_key))
+        separator = ','
+    yield '}' if separator == ',' else '{}'
@@ -0,0 +1,216 @@
+import bisect
+import heapq
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import bump_version, get_versions
+from .executors import run_in_background
+from .query import normalize
+from .scopes import MODELS_BY_SCOPE, SEARCH_FIELDS_BY_SCOPE, get_label, get_visible_queryset
+
+
+def get_keys(scope, values):
+    """
+    Profiles are found by first name, last name or both; everything else by
+    any word of its title onwards.
+    """
+    if scope == 'profiles':
+        keys = {normalize(value) for value in values}
+        keys.add(normalize(get_label(values)))
+    else:
+        words = normalize(get_label(values)).split(' ')
+        keys = {' '.join(words[index:]) for index in range(len(words))}
+    keys.discard('')
+    return keys
+
+
+class SuggestIndex(object):
+    """
+    An in-memory prefix index over the searchable names of every scope: a
+    sorted array of (key, uuid) pairs per scope, searched with bisect.
+
+    Once max_entries keys are exceeded the index stops growing and reports
+    itself incomplete, so callers can fall back to the database.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self.entries = dict((scope, []) for scope in MODELS_BY_SCOPE)
+        self.labels = dict((scope, {}) for scope in MODELS_BY_SCOPE)
+        self.keys = dict((scope, {}) for scope in MODELS_BY_SCOPE)
+        self.size = 0
+        self.complete = True
+
+    def add(self, scope, uuid, values):
+        with self.lock:
+            self.remove(scope, uuid)
+            keys = get_keys(scope, values)
+            if self.size + len(keys) > self.max_entries:
+                self.complete = False
+                return
+            for key in keys:
+                bisect.insort(self.entries[scope], (key, uuid))
+            self.labels[scope][uuid] = get_label(values)
+            self.keys[scope][uuid] = keys
+            self.size += len(keys)
+
+    def remove(self, scope, uuid):
+        with self.lock:
+            entries = self.entries[scope]
+            for key in self.keys[scope].pop(uuid, ()):
+                index = bisect.bisect_left(entries, (key, uuid))
+                if index < len(entries) and entries[index] == (key, uuid):
+                    del entries[index]
+                    self.size -= 1
+            self.labels[scope].pop(uuid, None)
+
+    def suggest(self, scope, prefix, limit):
+        """
+        The `limit` best of the first SEARCH_SUGGEST_MAX_CANDIDATES entries
+        with a key starting with `prefix`: labels the prefix matches from
+        their first word on come before the ones it matches later, and short
+        labels, the closest matches, before long ones.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        max_candidates = getattr(settings, 'SEARCH_SUGGEST_MAX_CANDIDATES', 1000)
+        ranks = {}
+        with self.lock:
+            entries = self.entries[scope]
+            index = bisect.bisect_left(entries, (prefix,))
+            end = min(index + max_candidates, len(entries))
+            while index < end:
+                key, uuid = entries[index]
+                if not key.startswith(prefix):
+                    break
+                label = self.labels[scope][uuid]
+                # Keys are the label from one of its words on, so this is
+                # where in the label the prefix matched.
+                rank = (len(label) - len(key), len(label), label, uuid)
+                if uuid not in ranks or rank < ranks[uuid]:
+                    ranks[uuid] = rank
+                index += 1
+        return [{'uuid': rank[3], 'label': rank[2]} for rank in heapq.nsmallest(limit, ranks.values())]
+
+    def get_memory_size(self):
+        with self.lock:
+            size = 0
+            for scope, entries in self.entries.items():
+                size += sys.getsizeof(entries)
+                for entry in entries:
+                    size += sys.getsizeof(entry) + sys.getsizeof(entry[0])
+            return size
+
+    @classmethod
+    def build(cls, max_entries):
+        """
+        Collects the entries of every scope and sorts them once, rather than
+        inserting them one by one.
+        """
+        index = cls(max_entries)
+        for scope, fields in SEARCH_FIELDS_BY_SCOPE.items():
+            entries = index.entries[scope]
+            for row in get_visible_queryset(scope).values_list('uuid', *fields).iterator():
+                uuid = str(row[0])
+                keys = get_keys(scope, row[1:])
+                if index.size + len(keys) > max_entries:
+                    index.complete = False
+                    break
+                entries.extend((key, uuid) for key in keys)
+                index.labels[scope][uuid] = get_label(row[1:])
+                index.keys[scope][uuid] = keys
+                index.size += len(keys)
+            entries.sort()
+            if not index.complete:
+                break
+        return index
+
+
+_index = None
+_index_built = None
+_index_generation = None
+_index_lock = threading.Lock()
+
+
+def bump_generation():
+    return bump_version('suggest')
+
+
+def build_suggest_index(generation):
+    global _index, _index_built, _index_generation
+    index = SuggestIndex.build(getattr(settings, 'SEARCH_SUGGEST_MAX_ENTRIES', 1000000))
+    with _index_lock:
+        _index, _index_built, _index_generation = index, time.time(), generation
+
+
+def get_suggest_index():
+    """
+    Returns this process' index, or None until the first one is built. The
+    search signals keep it up to date with the writes of this process; a new
+    one is built in the background, and swapped in once complete, every
+    SEARCH_SUGGEST_REBUILD_INTERVAL seconds and once the search_rebuild_suggest
+    command has bumped the generation, which is how the writes of other
+    processes reach it. Until then get_visible_suggestions() drops what they
+    have deleted or hidden.
+    """
+    generation = get_versions(['suggest'])['suggest']
+    with _index_lock:
+        index, built, index_generation = _index, _index_built, _index_generation
+    if (
+        index is None or generation != index_generation or
+        time.time() - built > getattr(settings, 'SEARCH_SUGGEST_REBUILD_INTERVAL', 3600)
+    ):
+        run_in_background('suggest', build_suggest_index, generation)
+    return _index
+
+
+def get_visible_suggestions(index, scope, prefix, limit):
+    """
+    The suggestions of `index` that are still visible, checked with one query
+    over the uuids returned, and a second one when some were not and the
+    index is asked again without them.
+    """
+    for attempt in range(2):
+        suggestions = index.suggest(scope, prefix, limit)
+        uuids = [suggestion['uuid'] for suggestion in suggestions]
+        visible = set(str(uuid) for uuid in get_visible_queryset(scope).filter(uuid__in=uuids).values_list(
+            'uuid', flat=True
+        ))
+        if len(visible) == len(uuids):
+            return suggestions
+        for uuid in set(uuids) - visible:
+            index.remove(scope, uuid)
+    return [suggestion for suggestion in suggestions if suggestion['uuid'] in visible]
+
+
+def update_suggest_index(scope, instance):
+    refresh_suggest_index(scope, [instance.pk])
+
+
+def refresh_suggest_index(scope, pks):
+    """
+    Adds the rows of `pks` that are visible to the index and removes the
+    others. Only an index this process has already built is kept up to date;
+    the others pick the change up on their next rebuild.
+    """
+    index = _index
+    if index is None:
+        return
+    uuids = set(str(uuid) for uuid in MODELS_BY_SCOPE[scope].objects.filter(pk__in=pks).values_list('uuid', flat=True))
+    for row in get_visible_queryset(scope).filter(pk__in=pks).values_list('uuid', *SEARCH_FIELDS_BY_SCOPE[scope]):
+        uuid = str(row[0])
+        index.add(scope, uuid, row[1:])
+        uuids.discard(uuid)
+    for uuid in uuids:
+        index.remove(scope, uuid)
+
+
+def remove_from_suggest_index(scope, instance):
+    index = _index
+    if index is not None:
+        index.remove(scope, str(instance.uuid))
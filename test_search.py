@@ -1,14 +1,43 @@
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.apps import apps as global_apps
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import IntegrityError, connection
+from django.db.migrations.loader import MigrationLoader
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from apps.abstract.utils import print_response, JSON_TS, create_user_with_profile
+from apps.api.exceptions import BadRequest
 from apps.communities.models import Community, CommunitySubject
 from apps.galleries.models import VideoItem, AudioItem, TextItem
 from apps.posts.models import Post
 
+from . import signals, suggest, views
+from .benchmark import SCOPE_COMBINATIONS, run_search_benchmark, seed_search_data
+from .backends import PostgresFullTextBackend, SearchDocumentBackend, SnapshotBackend
+from .cache import LocalLRUCache, get_result_cache
+from .documents import get_search_document_lag, process_search_document_updates
+from .metrics import InMemoryMetricsSink, get_metrics_sink
+from .models import SearchDocument, SearchDocumentUpdate, SearchQueryLog
+from .query import normalize, parse_query
+from .querylog import QueryLogBuffer, flush_query_log, get_hot_queries, get_query_log_buffer
+from .snapshot import ScopeSnapshot, get_search_snapshot
+from .social import SocialGraph
+from .streaming import prefetch_batches
+from .views import CommonSearchAPI, CommonSearchBatchAPI
 
-class CommonSearchAPITest(TestCase):
+
+class CommonSearchAPITestMixin(object):
 
     def setUp(self):
         self.c = APIClient()
@@ -114,6 +143,44 @@ class CommonSearchAPITest(TestCase):
     def get_uuids(self, data):
         return [i['uuid'] for i in data]
 
+    def get_search_statements(self, context, name):
+        return [q['sql'] for q in context.captured_queries if name.lower() in q['sql'].lower()]
+
+    def create_video_items(self, count, title="Found video"):
+        return [
+            VideoItem.objects.create(
+                author=self.user01,
+                gallery=None,
+                title=title,
+                content_object=self.user01p,
+                source="youtube",
+                source_id="Youtube video",
+                source_duration=43,
+                source_cover_url='/home/rp/env/project/public/media/no_image.png',
+                submitted=True
+            ) for i in range(count)
+        ]
+
+
+class CommonSearchAPITest(CommonSearchAPITestMixin, TestCase):
+
+    # The status of the profile found reads the viewer's profile, then one
+    # query per relationship.
+    STATUS_QUERIES = 7
+    # One per scope, rows and count included, except for the three gallery
+    # scopes, which share one UNION query and then load their rows by pk.
+    ALL_SEARCH_QUERIES = 3 + 1 + 3
+
+    def get_request_queries(self):
+        """
+        The queries every request runs before it searches, such as reading the
+        session and the user, counted on a request rejected right after.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.search(name="Found", scope="bad_scope")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        return len(context.captured_queries)
+
     def test_bad_scope(self):
 
         self.c.login(username=self.user01.username, password='111')
@@ -135,6 +202,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'user': {
@@ -156,6 +224,40 @@ class CommonSearchAPITest(TestCase):
             ]
         })
 
+    def test_profiles_search_by_full_name(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="found us", scope="profiles")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 1)
+        self.assertEqual(
+            response.data['found_items'][0]['user']['uuid'], self.found_userp.uuid_str()
+        )
+
+    def test_profiles_search_query_count(self):
+        create_user_with_profile('found_user01@test.com', first_name="Found", last_name="User")
+
+        self.c.login(username=self.user01.username, password='111')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.search(name="Found", scope="profiles")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 1)
+
+        for i in range(2, 5):
+            create_user_with_profile(
+                'found_user{:02d}@test.com'.format(i),
+                first_name="Found",
+                last_name="User"
+            )
+
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.search(name="Found", scope="profiles")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 4)
+
     def test_bad_scope_2(self):
 
         self.c.login(username=self.user01.username, password='111')
@@ -187,6 +289,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'user': {
@@ -226,6 +329,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'user': {
@@ -274,6 +378,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'user': {
@@ -322,6 +427,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'user': {
@@ -344,6 +450,83 @@ class CommonSearchAPITest(TestCase):
             ]
         })
 
+    def test_profiles_followers_search_excludes_friends(self):
+        self.c.login(username=self.user01.username, password='111')
+
+        found_friend_user, found_friend_userp = create_user_with_profile(
+            'found_friend_user@test.com',
+            first_name="Found Friend",
+            last_name="User"
+        )
+        self.user01p.friend_user(found_friend_user)
+        found_friend_userp.follow_user(self.user01)
+
+        response = self.search(name="Found", scope="profiles", scope_2="followers")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 0)
+        self.assertEqual(response.data['found_items'], [])
+
+        response = self.search(name="Found", scope="profiles", scope_2="others")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 0)
+
+    def test_profiles_search_status(self):
+        self.c.login(username=self.user01.username, password='111')
+
+        requested_user, requested_userp = create_user_with_profile(
+            'found_requested_user@test.com',
+            first_name="Found Requested",
+            last_name="User"
+        )
+        requesting_user, requesting_userp = create_user_with_profile(
+            'found_requesting_user@test.com',
+            first_name="Found Requesting",
+            last_name="User"
+        )
+        blocked_user, blocked_userp = create_user_with_profile(
+            'found_blocked_user@test.com',
+            first_name="Found Blocked",
+            last_name="User"
+        )
+        requested_userp.follow_user(self.user01)
+        self.user01.friendship_requests_sent.create(to_user=requested_user)
+        requesting_user.friendship_requests_sent.create(to_user=self.user01)
+        self.user01p.blocked.add(blocked_user)
+
+        with mock.patch.object(SocialGraph, 'friend_ids', new_callable=mock.PropertyMock) as friend_ids:
+            response = self.search(name="Found", scope="profiles")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Statuses are resolved for the page only, not from the full relationship sets.
+        self.assertFalse(friend_ids.called)
+        statuses = dict((item['user']['uuid'], item['status']) for item in response.data['found_items'])
+        self.assertEqual(statuses, {
+            requested_userp.uuid_str(): {
+                'is_friend': False,
+                'is_follower': True,
+                'friendship_request_sent': True,
+                'is_followed': False,
+                'is_blocked': False,
+                'is_inbox_request': False,
+                'is_outbox_request': True
+            },
+            requesting_userp.uuid_str(): {
+                'is_friend': False,
+                'is_follower': False,
+                'is_followed': False,
+                'is_blocked': False,
+                'is_inbox_request': True,
+                'is_outbox_request': False
+            },
+            blocked_userp.uuid_str(): {
+                'is_friend': False,
+                'is_follower': False,
+                'is_followed': False,
+                'is_blocked': True,
+                'is_inbox_request': False,
+                'is_outbox_request': False
+            },
+        })
+
     def test_communities_search(self):
 
         self.create_search_items()
@@ -355,6 +538,7 @@ class CommonSearchAPITest(TestCase):
 
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'uuid': self.found_community.uuid_str(),
@@ -378,6 +562,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'uuid': self.found_video_item.uuid_str(),
@@ -420,6 +605,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'uuid': self.found_audio_item.uuid_str(),
@@ -459,6 +645,7 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_items': [
                 {
                     'uuid': self.found_text_item.uuid_str(),
@@ -499,6 +686,38 @@ class CommonSearchAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_items_count': 1,
+            'found_items_next_cursor': None,
+            'found_posts': [
+                {
+                    'uuid': self.found_post.uuid_str(),
+                    'date_created': self.found_post.date_created.strftime(JSON_TS),
+                    'author': {
+                        'uuid': self.user01p.uuid_str(),
+                        'first_name': "FirstName",
+                        'last_name': "LastName",
+                        'gender': "M",
+                        'avatar': None
+                    },
+                    'title': "Found post",
+                    'comments_count': 0,
+                    'is_liked': False,
+                    'likes_count': 0,
+                    'reposts_count': 0
+                }
+            ]
+        })
+
+    def test_posts_search_all_fields(self):
+
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="posts", fields="all")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'found_items_count': 1,
+            'found_items_next_cursor': None,
             'found_posts': [
                 {
                     'uuid': self.found_post.uuid_str(),
@@ -527,16 +746,72 @@ class CommonSearchAPITest(TestCase):
             ]
         })
 
+    def test_video_search_fields(self):
+
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.search(name="Found", scope="video", fields="uuid,title")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items'], [
+            {
+                'uuid': self.found_video_item.uuid_str(),
+                'title': "Found video"
+            }
+        ])
+        search_statement, = self.get_search_statements(context, "Found")
+        self.assertNotIn('description', search_statement)
+
+    def test_all_search_fields_per_scope(self):
+
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", posts_fields="uuid,text", audio_fields="title")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_posts'], [
+            {
+                'uuid': self.found_post.uuid_str(),
+                'text': "Found post text"
+            }
+        ])
+        self.assertEqual(response.data['found_audio'], [{'title': "Found audio"}])
+        self.assertIn('source_description', response.data['found_video'][0])
+
+    def test_bad_fields(self):
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video", fields="uuid,bad_field")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'detail': "Unexpected field: bad_field"
+        })
+
     def test_all_search(self):
 
         self.create_search_items()
 
         self.c.login(username=self.user01.username, password='111')
 
+        # Projected onto columns of their own rows, the items cost no queries
+        # of their own, so this is every query of the request.
+        fields = dict(('{}_fields'.format(key), 'uuid') for key in CommonSearchAPI.SCOPES if key != 'profiles')
+        request_queries = self.get_request_queries()
+        with self.assertNumQueries(request_queries + self.ALL_SEARCH_QUERIES + self.STATUS_QUERIES):
+            response = self.search(name="Found", profiles_fields="status", **fields)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_video'], [{'uuid': self.found_video_item.uuid_str()}])
+
         response = self.search(name="Found")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, {
             'found_profiles_count': 1,
+            'found_profiles_next_cursor': None,
             'found_profiles': [
                 {
                     'user': {
@@ -557,6 +832,7 @@ class CommonSearchAPITest(TestCase):
                 }
             ],
             'found_communities_count': 1,
+            'found_communities_next_cursor': None,
             'found_communities': [
                 {
                     'uuid': self.found_community.uuid_str(),
@@ -569,6 +845,7 @@ class CommonSearchAPITest(TestCase):
                 }
             ],
             'found_video_count': 1,
+            'found_video_next_cursor': None,
             'found_video': [
                 {
                     'uuid': self.found_video_item.uuid_str(),
@@ -600,6 +877,7 @@ class CommonSearchAPITest(TestCase):
                 }
             ],
             'found_audio_count': 1,
+            'found_audio_next_cursor': None,
             'found_audio': [
                 {
                     'uuid': self.found_audio_item.uuid_str(),
@@ -628,6 +906,7 @@ class CommonSearchAPITest(TestCase):
                 }
             ],
             'found_text_count': 1,
+            'found_text_next_cursor': None,
             'found_text': [
                 {
                     'uuid': self.found_text_item.uuid_str(),
@@ -657,6 +936,7 @@ class CommonSearchAPITest(TestCase):
                 }
             ],
             'found_posts_count': 1,
+            'found_posts_next_cursor': None,
             'found_posts': [
                 {
                     'uuid': self.found_post.uuid_str(),
@@ -669,18 +949,1426 @@ class CommonSearchAPITest(TestCase):
                         'avatar': None
                     },
                     'title': "Found post",
-                    'text': "Found post text",
-                    'picture_items': [],
-                    'video_items': [],
-                    'audio_items': [],
-                    'text_items': [],
-                    'comments': [],
                     'comments_count': 0,
                     'is_liked': False,
                     'likes_count': 0,
-                    'recent_likes': [],
-                    'reposts': [],
                     'reposts_count': 0
                 }
             ]
         })
+
+    def test_video_search_pages(self):
+        video_items = self.create_video_items(3)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video", limit=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 3)
+        self.assertEqual(
+            self.get_uuids(response.data['found_items']),
+            [video_items[2].uuid_str(), video_items[1].uuid_str()]
+        )
+        self.assertIsNotNone(response.data['found_items_next_cursor'])
+
+        response = self.search(
+            name="Found", scope="video", limit=2, cursor=response.data['found_items_next_cursor']
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 3)
+        self.assertEqual(self.get_uuids(response.data['found_items']), [video_items[0].uuid_str()])
+        self.assertIsNone(response.data['found_items_next_cursor'])
+
+    def test_all_search_pages_per_scope(self):
+        self.create_search_items()
+        video_items = self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", video_limit=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_video_count'], 3)
+        self.assertEqual(self.get_uuids(response.data['found_video']), [video_items[1].uuid_str()])
+        self.assertIsNotNone(response.data['found_video_next_cursor'])
+        self.assertEqual(response.data['found_audio_count'], 1)
+        self.assertIsNone(response.data['found_audio_next_cursor'])
+
+        response = self.search(
+            name="Found", video_limit=1, video_cursor=response.data['found_video_next_cursor']
+        )
+        self.assertEqual(self.get_uuids(response.data['found_video']), [video_items[0].uuid_str()])
+
+    def test_bad_cursor(self):
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video", cursor="bad_cursor")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'detail': "Invalid cursor"
+        })
+
+    def test_bad_limit(self):
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video", limit=0)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'detail': "Limit must be between 1 and 100"
+        })
+
+    def test_all_search_preview(self):
+        self.create_search_items()
+        video_items = self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", preview=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_uuids(response.data['found_video']), [video_items[1].uuid_str()])
+        self.assertEqual(response.data['found_video_count'], 3)
+        self.assertTrue(response.data['found_video_count_is_exact'])
+        self.assertIsNotNone(response.data['found_video_next_cursor'])
+        self.assertEqual(self.get_uuids(response.data['found_text']), [self.found_text_item.uuid_str()])
+        self.assertEqual(response.data['found_text_count'], 1)
+        self.assertTrue(response.data['found_text_count_is_exact'])
+        self.assertIsNone(response.data['found_text_next_cursor'])
+
+        response = self.search(
+            name="Found", scope="video", cursor=response.data['found_video_next_cursor']
+        )
+        self.assertEqual(
+            self.get_uuids(response.data['found_items']),
+            [video_items[0].uuid_str(), self.found_video_item.uuid_str()]
+        )
+
+    def test_all_search_preview_bounded_count(self):
+        self.create_search_items()
+        self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        with mock.patch.object(CommonSearchAPI, 'PREVIEW_COUNT_LIMIT', 2):
+            response = self.search(name="Found", preview=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['found_video']), 1)
+        self.assertEqual(response.data['found_video_count'], 2)
+        self.assertFalse(response.data['found_video_count_is_exact'])
+
+    @override_settings(SEARCH_COUNT_THRESHOLD=2)
+    def test_video_search_count_strategies(self):
+        self.create_video_items(4)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video", limit=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 4)
+        self.assertNotIn('found_items_count_is_exact', response.data)
+
+        response = self.search(name="Found", scope="video", limit=1, count="capped")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 2)
+        self.assertFalse(response.data['found_items_count_is_exact'])
+
+        response = self.search(name="Found", scope="video", limit=1, count="estimate")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(response.data['found_items_count'], 2)
+        self.assertFalse(response.data['found_items_count_is_exact'])
+
+        with override_settings(SEARCH_COUNT_THRESHOLD=10):
+            response = self.search(name="Found", scope="video", limit=1, count="capped")
+        self.assertEqual(response.data['found_items_count'], 4)
+        self.assertTrue(response.data['found_items_count_is_exact'])
+
+        with override_settings(SEARCH_COUNT_STRATEGY='capped'):
+            response = self.search(name="Found", video_limit=1)
+        self.assertEqual(response.data['found_video_count'], 2)
+        self.assertFalse(response.data['found_video_count_is_exact'])
+        self.assertEqual(response.data['found_audio_count'], 0)
+        self.assertTrue(response.data['found_audio_count_is_exact'])
+
+    def test_search_normalizes_name(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video")
+        # Fullwidth F, Cyrillic О and extra whitespace.
+        normalized_response = self.search(name="  \uff26\u041eUND  ", scope="video")
+        self.assertEqual(normalized_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(normalized_response.data, response.data)
+        self.assertEqual(self.get_uuids(response.data['found_items']), [self.found_video_item.uuid_str()])
+
+    def test_bad_name(self):
+
+        self.c.login(username=self.user01.username, password='111')
+
+        for name, detail in (
+            ("", "Empty name"), ("   ", "Empty name"), (" F ", "Name must be at least 2 characters long")
+        ):
+            response = self.search(name=name)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data, {'detail': detail})
+
+        response = self.c.get(reverse('api_common_search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bad_count(self):
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", count="bad_count")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'detail': "Unexpected count: bad_count"
+        })
+
+    def test_bad_preview(self):
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", preview="bad_preview")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'detail': "Invalid preview: bad_preview"
+        })
+
+
+@skipUnless(connection.vendor == 'postgresql', "Full-text search needs PostgreSQL")
+@override_settings(SEARCH_BACKEND=PostgresFullTextBackend)
+class PostgresFullTextSearchAPITest(CommonSearchAPITest):
+
+    def test_video_search_ranks_by_relevance(self):
+        found_video_item, = self.create_video_items(1, title="Found video")
+        found_found_video_item, = self.create_video_items(1, title="Found found video")
+        self.create_video_items(1, title="Found again")
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="found video", scope="video", limit=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 2)
+
+        self.assertEqual(self.get_uuids(response.data['found_items']), [found_found_video_item.uuid_str()])
+
+        response = self.search(
+            name="found video", scope="video", limit=1, cursor=response.data['found_items_next_cursor']
+        )
+        self.assertEqual(self.get_uuids(response.data['found_items']), [found_video_item.uuid_str()])
+        self.assertIsNone(response.data['found_items_next_cursor'])
+
+    def test_video_search_pages_through_rank_ties(self):
+        # Equal ranks are compared with the rank in the cursor, which only
+        # round-trips exactly as a double precision value.
+        video_items = self.create_video_items(5, title="Found tied video")
+
+        self.c.login(username=self.user01.username, password='111')
+
+        uuids, cursor = [], None
+        for i in range(5):
+            params = {'name': "found video", 'scope': "video", 'limit': 1}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.search(**params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            uuids += self.get_uuids(response.data['found_items'])
+            cursor = response.data['found_items_next_cursor']
+        self.assertIsNone(cursor)
+        self.assertEqual(uuids, [video_item.uuid_str() for video_item in reversed(video_items)])
+
+
+@override_settings(SEARCH_BACKEND=SearchDocumentBackend, SEARCH_QUEUE_DOCUMENT_UPDATES=False)
+class SearchDocumentSearchAPITest(CommonSearchAPITest):
+
+    # The unscoped search is one grouped query over the search documents,
+    # then one per scope for its rows.
+    ALL_SEARCH_QUERIES = 1 + 6
+
+    def test_documents_follow_changes(self):
+        self.create_search_items()
+
+        self.assertEqual(
+            SearchDocument.objects.get(scope='video', object_id=self.found_video_item.pk).text, "found video"
+        )
+        self.assertEqual(
+            SearchDocument.objects.get(scope='profiles', object_id=self.found_userp.pk).text, "found user"
+        )
+
+        self.found_video_item.title = "Renamed video"
+        self.found_video_item.save()
+        self.assertEqual(
+            SearchDocument.objects.get(scope='video', object_id=self.found_video_item.pk).text, "renamed video"
+        )
+
+        self.found_post.delete()
+        self.assertFalse(SearchDocument.objects.visible().filter(scope='posts', object_id=self.found_post.pk).exists())
+
+    def test_hits_are_checked_for_visibility(self):
+        self.create_search_items()
+        # A change the documents do not follow, such as the privacy of a gallery.
+        VideoItem.objects.filter(pk=self.found_video_item.pk).update(submitted=False)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_video'], [])
+
+    def test_all_search_pages(self):
+        video_items = self.create_video_items(3)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", video_limit=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_video_count'], 3)
+        self.assertEqual(
+            self.get_uuids(response.data['found_video']), [video_items[2].uuid_str(), video_items[1].uuid_str()]
+        )
+
+        response = self.search(name="Found", scope="video", limit=2, cursor=response.data['found_video_next_cursor'])
+        self.assertEqual(self.get_uuids(response.data['found_items']), [video_items[0].uuid_str()])
+
+    def test_video_search_ranks_by_match_tier(self):
+        exact_video_item, = self.create_video_items(1, title="Found")
+        prefix_video_item, = self.create_video_items(1, title="Found video")
+        infix_video_item, = self.create_video_items(1, title="Lost and found")
+        expected = [exact_video_item.uuid_str(), prefix_video_item.uuid_str(), infix_video_item.uuid_str()]
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="found", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_uuids(response.data['found_items']), expected)
+
+        response = self.search(name="found")
+        self.assertEqual(self.get_uuids(response.data['found_video']), expected)
+
+        uuids, cursor = [], None
+        for page in range(3):
+            params = {'cursor': cursor} if cursor else {}
+            response = self.search(name="found", scope="video", limit=1, **params)
+            uuids += self.get_uuids(response.data['found_items'])
+            cursor = response.data['found_items_next_cursor']
+        self.assertEqual(uuids, expected)
+        self.assertIsNone(cursor)
+
+    def test_profiles_search_ranks_by_followers(self):
+        alpha_user, alpha_userp = create_user_with_profile('alpha@test.com', first_name="Found", last_name="Alpha")
+        beta_user, beta_userp = create_user_with_profile('beta@test.com', first_name="Found", last_name="Beta")
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="found", scope="profiles")
+        self.assertEqual(
+            [i['user']['uuid'] for i in response.data['found_items']], [alpha_userp.uuid_str(), beta_userp.uuid_str()]
+        )
+
+        self.user01p.follow_user(beta_user)
+        self.assertEqual(SearchDocument.objects.get(scope='profiles', object_id=beta_userp.pk).popularity, 1)
+
+        response = self.search(name="found", scope="profiles")
+        self.assertEqual(
+            [i['user']['uuid'] for i in response.data['found_items']], [beta_userp.uuid_str(), alpha_userp.uuid_str()]
+        )
+
+    def test_search_documents_are_lowercased(self):
+        video_item, = self.create_video_items(1, title="Stra\u00dfe")
+        self.assertEqual(SearchDocument.objects.get(scope='video', object_id=video_item.pk).text, "stra\u00dfe")
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="STRA\u00dfE", scope="video")
+        self.assertEqual(self.get_uuids(response.data['found_items']), [video_item.uuid_str()])
+
+    def test_posts_search_ranks_by_likes(self):
+        older_post = Post.objects.create(title="Found older", text="", author=self.user01, content_object=self.user01p)
+        newer_post = Post.objects.create(title="Found newer", text="", author=self.user01, content_object=self.user01p)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="found", scope="posts")
+        self.assertEqual(
+            self.get_uuids(response.data['found_posts']), [newer_post.uuid_str(), older_post.uuid_str()]
+        )
+
+        older_post.likes_count = 5
+        older_post.save()
+        self.assertEqual(SearchDocument.objects.get(scope='posts', object_id=older_post.pk).popularity, 5)
+
+        response = self.search(name="found", scope="posts")
+        self.assertEqual(
+            self.get_uuids(response.data['found_posts']), [older_post.uuid_str(), newer_post.uuid_str()]
+        )
+
+    def test_rebuild_documents(self):
+        self.create_search_items()
+        SearchDocument.objects.all().delete()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found")
+        self.assertEqual(response.data['found_video_count'], 0)
+
+        call_command('search_rebuild_documents', stdout=StringIO())
+
+        response = self.search(name="Found")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_uuids(response.data['found_video']), [self.found_video_item.uuid_str()])
+        self.assertEqual(response.data['found_profiles_count'], 1)
+        self.assertEqual(response.data['found_posts_count'], 1)
+
+
+@override_settings(SEARCH_BACKEND=SearchDocumentBackend, SEARCH_QUEUE_DOCUMENT_UPDATES=True)
+class SearchDocumentQueueTest(CommonSearchAPITestMixin, TestCase):
+
+    @override_settings(SEARCH_BACKEND=None)
+    def test_documents_only_maintained_for_their_backend(self):
+        self.create_search_items()
+        self.assertFalse(SearchDocumentUpdate.objects.exists())
+
+        with override_settings(SEARCH_DOCUMENTS=True):
+            self.create_video_items(1)
+        self.assertEqual(SearchDocumentUpdate.objects.filter(scope='video').count(), 1)
+
+    def test_search_is_eventually_consistent(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_video'], [])
+        self.assertEqual(response.data['found_posts_count'], 0)
+
+        process_search_document_updates()
+
+        response = self.search(name="Found")
+        self.assertEqual(self.get_uuids(response.data['found_video']), [self.found_video_item.uuid_str()])
+        self.assertEqual(response.data['found_posts_count'], 1)
+
+        self.found_video_item.title = "Renamed video"
+        self.found_video_item.save()
+
+        response = self.search(name="Renamed", scope="video")
+        self.assertEqual(response.data['found_items_count'], 0)
+
+        process_search_document_updates()
+
+        response = self.search(name="Renamed", scope="video")
+        self.assertEqual(self.get_uuids(response.data['found_items']), [self.found_video_item.uuid_str()])
+        response = self.search(name="Found", scope="video")
+        self.assertEqual(response.data['found_items_count'], 0)
+
+    def test_updates_are_coalesced_per_entity(self):
+        video_item, = self.create_video_items(1)
+        for title in ("Found again", "Found once more"):
+            video_item.title = title
+            video_item.save()
+        queued = SearchDocumentUpdate.objects.filter(scope='video').count()
+        self.assertGreaterEqual(queued, 3)
+
+        with CaptureQueriesContext(connection) as context:
+            updates, entities = process_search_document_updates()
+        self.assertEqual((updates, entities), (queued, 1))
+        self.assertEqual(len([q for q in context.captured_queries if 'INSERT' in q['sql']]), 1)
+        self.assertEqual(SearchDocument.objects.get(scope='video', object_id=video_item.pk).text, "found once more")
+        self.assertFalse(SearchDocumentUpdate.objects.exists())
+
+    def test_batches(self):
+        self.create_video_items(5)
+        pending, lag = get_search_document_lag()
+
+        self.assertEqual(process_search_document_updates(batch_size=2)[0], 2)
+        self.assertEqual(get_search_document_lag()[0], pending - 2)
+
+        call_command('search_process_document_updates', '--once', '--batch-size=2', stdout=StringIO())
+        self.assertEqual(get_search_document_lag(), (0, 0.0))
+        self.assertEqual(SearchDocument.objects.filter(scope='video').count(), 5)
+
+    def test_concurrent_replace(self):
+        video_item, = self.create_video_items(1)
+        bulk_create = SearchDocument.objects.bulk_create
+        calls = []
+
+        def conflicting_bulk_create(documents):
+            # As if another worker had inserted the same documents after our delete.
+            calls.append(documents)
+            if len(calls) == 1:
+                raise IntegrityError("duplicate key value violates unique constraint")
+            return bulk_create(documents)
+
+        with mock.patch.object(SearchDocument.objects, 'bulk_create', side_effect=conflicting_bulk_create):
+            self.assertEqual(process_search_document_updates(), (1, 1))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(SearchDocument.objects.filter(scope='video', object_id=video_item.pk).count(), 1)
+
+    def test_lag(self):
+        self.create_video_items(1)
+
+        pending, lag = get_search_document_lag()
+        self.assertEqual(pending, 1)
+        self.assertGreaterEqual(lag, 0)
+
+        SearchDocumentUpdate.objects.update(date_queued=timezone.now() - timedelta(minutes=5))
+        with self.assertRaises(CommandError):
+            call_command('search_document_lag', '--max-lag=60', stdout=StringIO())
+
+
+@override_settings(SEARCH_BACKEND=SnapshotBackend, SEARCH_SNAPSHOT_MAX_STALENESS=0, SEARCH_BACKGROUND_REBUILDS=False)
+class SnapshotSearchAPITest(CommonSearchAPITest):
+
+    # Only the profiles of an unscoped search are matched in the database;
+    # the first search builds the snapshot of the other five scopes, and the
+    # rows of all six are loaded by pk.
+    ALL_SEARCH_QUERIES = 1 + 5 + 6
+
+    def setUp(self):
+        super(SnapshotSearchAPITest, self).setUp()
+        get_search_snapshot().clear()
+
+    def test_video_search_infix(self):
+        video_item, = self.create_video_items(1)
+        infix_video_item, = self.create_video_items(1, title="Lost and found")
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video")
+        self.assertEqual(self.get_uuids(response.data['found_items']), [video_item.uuid_str()])
+
+        with override_settings(SEARCH_SNAPSHOT_MATCH='infix'):
+            response = self.search(name="Found", scope="video")
+        self.assertEqual(
+            self.get_uuids(response.data['found_items']), [infix_video_item.uuid_str(), video_item.uuid_str()]
+        )
+
+    def test_video_search_pages_in_snapshot(self):
+        video_items = self.create_video_items(5)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        uuids, cursor = [], None
+        with mock.patch.object(SnapshotBackend, 'filter_queryset') as filter_queryset:
+            for i in range(3):
+                params = {'name': "Found", 'scope': "video", 'limit': 2}
+                if cursor:
+                    params['cursor'] = cursor
+                response = self.search(**params)
+                self.assertEqual(response.data['found_items_count'], 5)
+                uuids += self.get_uuids(response.data['found_items'])
+                cursor = response.data['found_items_next_cursor']
+        self.assertFalse(filter_queryset.called)
+        self.assertIsNone(cursor)
+        self.assertEqual(uuids, [video_item.uuid_str() for video_item in reversed(video_items)])
+
+    def test_search_pages_galleries_in_snapshot(self):
+        video_items = self.create_video_items(3)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        for params in ({'scope_2': "friends"}, {'posts_cursor': ""}, {'stream': 1}):
+            wrapped = SnapshotBackend().filter_queryset
+            with mock.patch.object(SnapshotBackend, 'filter_queryset', wraps=wrapped) as filter_queryset:
+                response = self.search(name="Found", video_limit=5, **params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            if response.streaming:
+                data = json.loads(b''.join(response.streaming_content).decode())
+            else:
+                data = response.data
+            self.assertEqual(
+                self.get_uuids(data['found_video']), [video_item.uuid_str() for video_item in reversed(video_items)]
+            )
+            self.assertNotIn('video', [c[0][0] for c in filter_queryset.call_args_list])
+
+    @override_settings(SEARCH_COUNT_THRESHOLD=2)
+    def test_video_search_count_strategies(self):
+        # The snapshot counts every hit, so only a capped count is ever cut back.
+        self.create_video_items(4)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video", limit=1, count="capped")
+        self.assertEqual(response.data['found_items_count'], 2)
+        self.assertFalse(response.data['found_items_count_is_exact'])
+
+        response = self.search(name="Found", scope="video", limit=1, count="estimate")
+        self.assertEqual(response.data['found_items_count'], 4)
+        self.assertTrue(response.data['found_items_count_is_exact'])
+
+    def test_snapshot_staleness(self):
+        self.create_video_items(1)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        self.assertEqual(self.search(name="Found", scope="video").data['found_items_count'], 1)
+        with override_settings(SEARCH_SNAPSHOT_MAX_STALENESS=3600):
+            self.create_video_items(1)
+            self.assertEqual(self.search(name="Found", scope="video").data['found_items_count'], 1)
+        self.assertEqual(self.search(name="Found", scope="video").data['found_items_count'], 2)
+
+    @override_settings(SEARCH_SNAPSHOT_MAX_ROWS=1)
+    def test_scope_too_large_for_snapshot(self):
+        self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        self.assertIsNone(get_search_snapshot().get(['video'])['video'])
+        response = self.search(name="Found")
+        self.assertEqual(response.data['found_video_count'], 2)
+
+    @override_settings(SEARCH_BACKGROUND_REBUILDS=True)
+    def test_snapshot_built_in_background(self):
+        snapshot = ScopeSnapshot([])
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocked_build_scope(scope):
+            started.set()
+            release.wait(5)
+            return snapshot
+
+        with mock.patch.object(get_search_snapshot(), 'build_scope', side_effect=blocked_build_scope):
+            # Searches go to the database until the first snapshot is swapped in.
+            self.assertIsNone(get_search_snapshot().get(['video'])['video'])
+            self.assertTrue(started.wait(5))
+            self.assertIsNone(get_search_snapshot().get(['video'])['video'])
+            release.set()
+            for i in range(50):
+                if get_search_snapshot().get(['video'])['video'] is snapshot:
+                    break
+                time.sleep(0.1)
+            self.assertIs(get_search_snapshot().get(['video'])['video'], snapshot)
+
+
+class ScopeSnapshotTest(SimpleTestCase):
+
+    def setUp(self):
+        self.snapshot = ScopeSnapshot([
+            (3, None, "found video"), (2, None, "lost and found"), (1, None, "other"), (7, None, "found")
+        ])
+
+    def test_prefix(self):
+        self.assertEqual(self.snapshot.get_ids(self.snapshot.search(" Found ")), [3, 7])
+        self.assertEqual(self.snapshot.search("found v"), [0])
+        self.assertEqual(self.snapshot.search("video"), [])
+        self.assertEqual(self.snapshot.search(""), [])
+
+    def test_infix(self):
+        self.assertEqual(self.snapshot.get_ids(self.snapshot.search("found", 'infix')), [3, 2, 7])
+        self.assertEqual(self.snapshot.search("o", 'infix'), [0, 1, 2, 3])
+        self.assertEqual(self.snapshot.search("video\nlost", 'infix'), [])
+        self.assertEqual(ScopeSnapshot([]).search("found", 'infix'), [])
+
+
+@override_settings(SEARCH_CACHE_TIMEOUT=60)
+class CachedSearchAPITest(CommonSearchAPITest):
+
+    # Cached results are kept per scope, so the gallery scopes are not combined.
+    ALL_SEARCH_QUERIES = 6
+
+    def setUp(self):
+        super(CachedSearchAPITest, self).setUp()
+        get_result_cache().clear()
+        caches['default'].clear()
+
+    def test_video_search_cache_hit(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        first_response = self.search(name="Found", scope="video")
+        with CaptureQueriesContext(connection) as context:
+            response = self.search(name="Found", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_search_statements(context, "Found"), [])
+        self.assertEqual(response.data, first_response.data)
+
+    def test_video_search_cache_key_is_normalized(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        first_response = self.search(name="Found", scope="video")
+        with CaptureQueriesContext(connection) as context:
+            response = self.search(name=" fOUND ", scope="video")
+        self.assertEqual(self.get_search_statements(context, "Found"), [])
+        self.assertEqual(response.data, first_response.data)
+
+    def test_video_search_cache_invalidation(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video")
+        self.assertEqual(response.data['found_items_count'], 1)
+
+        video_item, = self.create_video_items(1)
+        response = self.search(name="Found", scope="video")
+        self.assertEqual(response.data['found_items_count'], 2)
+
+        video_item.delete()
+        response = self.search(name="Found", scope="video")
+        self.assertEqual(response.data['found_items_count'], 1)
+
+    def test_profiles_search_cache_per_user(self):
+        found_friend_user, found_friend_userp = create_user_with_profile(
+            'found_friend_user@test.com',
+            first_name="Found Friend",
+            last_name="User"
+        )
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="profiles", scope_2="friends")
+        self.assertEqual(response.data['found_items_count'], 0)
+
+        self.user01p.friend_user(found_friend_user)
+        response = self.search(name="Found", scope="profiles", scope_2="friends")
+        self.assertEqual(response.data['found_items_count'], 1)
+
+        self.c.login(username=found_friend_user.username, password='111')
+        response = self.search(name="Found", scope="profiles", scope_2="friends")
+        self.assertEqual(response.data['found_items_count'], 0)
+
+
+class ConditionalSearchAPITest(CommonSearchAPITestMixin, TestCase):
+
+    def setUp(self):
+        super(ConditionalSearchAPITest, self).setUp()
+        caches['default'].clear()
+
+    def search_if_none_match(self, etag, **kwargs):
+        return self.c.get(reverse('api_common_search'), kwargs, HTTP_IF_NONE_MATCH=etag)
+
+    def test_video_search_not_modified(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video")
+        etag = response['ETag']
+        with mock.patch.object(CommonSearchAPI, 'get_video_queryset') as get_video_queryset:
+            response = self.search_if_none_match(etag, name=" fOUND ", scope="video")
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            response = self.search_if_none_match('W/{}, "other"'.format(etag), name="Found", scope="video")
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(get_video_queryset.called)
+
+        response = self.search_if_none_match(etag, name="Found", scope="video", limit=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.create_video_items(1)
+        response = self.search_if_none_match(etag, name="Found", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 2)
+
+    def test_attached_items_modified(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        etag = self.search(name="Found", scope="video")['ETag']
+        # Saving the profile the items are attached to can hide them.
+        self.user01p.save()
+        response = self.search_if_none_match(etag, name="Found", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        self.found_userp.save()
+        response = self.search_if_none_match(etag, name="Found", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_all_search_not_modified(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        etag = self.search(name="Found")['ETag']
+        response = self.search_if_none_match(etag, name="Found")
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.create_video_items(1)
+        response = self.search_if_none_match(etag, name="Found")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_profiles_search_etag_per_user(self):
+        found_friend_user, found_friend_userp = create_user_with_profile(
+            'found_friend_user@test.com',
+            first_name="Found Friend",
+            last_name="User"
+        )
+
+        self.c.login(username=self.user01.username, password='111')
+
+        etag = self.search(name="Found", scope="profiles", scope_2="friends")['ETag']
+        self.user01p.friend_user(found_friend_user)
+        response = self.search_if_none_match(etag, name="Found", scope="profiles", scope_2="friends")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['found_items_count'], 1)
+
+        etag = response['ETag']
+        self.c.login(username=found_friend_user.username, password='111')
+        response = self.search_if_none_match(etag, name="Found", scope="profiles", scope_2="friends")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_profiles_search_statuses_modified(self):
+        found_other_user, found_other_userp = create_user_with_profile(
+            'found_other_user@test.com',
+            first_name="Found Other",
+            last_name="User"
+        )
+
+        self.c.login(username=self.user01.username, password='111')
+
+        # The statuses of found profiles change with blocks and friendship
+        # requests, well within SEARCH_ETAG_TIMEOUT.
+        changes = (
+            lambda: self.user01p.blocked.add(found_other_user),
+            lambda: self.user01p.blocked.remove(found_other_user),
+            lambda: self.user01.friendship_requests_sent.create(to_user=found_other_user),
+            lambda: self.user01.friendship_requests_sent.all().delete(),
+            lambda: found_other_user.friendship_requests_sent.create(to_user=self.user01),
+        )
+        etag = self.search(name="Found", scope="profiles")['ETag']
+        for change in changes:
+            change()
+            response = self.search_if_none_match(etag, name="Found", scope="profiles")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+
+    @override_settings(SEARCH_ETAG_TIMEOUT=None)
+    def test_etags_off(self):
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class GallerySearchAPITest(CommonSearchAPITestMixin, TestCase):
+
+    def get_union_statements(self, context):
+        return [q['sql'] for q in context.captured_queries if 'UNION ALL' in q['sql']]
+
+    def test_all_search_gallery_union(self):
+        self.create_search_items()
+        video_items = self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.search(name="Found", video_limit=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # One statement for the pages of the three scopes; only the video scope needs a count.
+        self.assertEqual(len(self.get_union_statements(context)), 1)
+        self.assertEqual(self.get_uuids(response.data['found_video']), [video_items[1].uuid_str()])
+        self.assertEqual(response.data['found_video_count'], 3)
+        self.assertEqual(self.get_uuids(response.data['found_audio']), [self.found_audio_item.uuid_str()])
+        self.assertEqual(response.data['found_audio_count'], 1)
+        self.assertIsNone(response.data['found_audio_next_cursor'])
+        self.assertEqual(self.get_uuids(response.data['found_text']), [self.found_text_item.uuid_str()])
+
+        response = self.search(
+            name="Found", scope="video", limit=2, cursor=response.data['found_video_next_cursor']
+        )
+        self.assertEqual(
+            self.get_uuids(response.data['found_items']), [video_items[0].uuid_str(), self.found_video_item.uuid_str()]
+        )
+
+    def test_all_search_gallery_union_capped_count(self):
+        self.create_video_items(3)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        with override_settings(SEARCH_COUNT_THRESHOLD=2):
+            response = self.search(name="Found", video_limit=1, count="capped")
+        self.assertEqual(response.data['found_video_count'], 2)
+        self.assertFalse(response.data['found_video_count_is_exact'])
+        self.assertEqual(response.data['found_text_count'], 0)
+        self.assertTrue(response.data['found_text_count_is_exact'])
+
+    def test_gallery_cursor_skips_union(self):
+        video_items = self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", video_limit=1)
+        with CaptureQueriesContext(connection) as context:
+            response = self.search(name="Found", video_limit=1, video_cursor=response.data['found_video_next_cursor'])
+        self.assertEqual(self.get_union_statements(context), [])
+        self.assertEqual(self.get_uuids(response.data['found_video']), [video_items[0].uuid_str()])
+
+
+class BatchSearchAPITest(CommonSearchAPITestMixin, TestCase):
+
+    def batch_search(self, data, user=None):
+        request = APIRequestFactory().post('/', data, format='json')
+        force_authenticate(request, user=user or self.user01)
+        return CommonSearchBatchAPI.as_view()(request)
+
+    def test_batch_search(self):
+        self.create_search_items()
+        found_friend_user, found_friend_userp = create_user_with_profile(
+            'found_friend_user@test.com',
+            first_name="Found Friend",
+            last_name="User"
+        )
+        self.user01p.friend_user(found_friend_user)
+
+        queries = [
+            {'name': "Found", 'scope': "profiles", 'scope_2': scope_2}
+            for scope_2 in ('friends', 'others', 'followeds', 'followers')
+        ]
+        queries.append({'name': " found ", 'scope': "video", 'limit': 1})
+
+        with mock.patch.object(views, 'SocialGraph', wraps=SocialGraph) as social_graph:
+            response = self.batch_search({'queries': queries})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(social_graph.call_count, 1)
+
+        self.c.login(username=self.user01.username, password='111')
+        self.assertEqual(len(response.data['results']), len(queries))
+        for params, result in zip(queries, response.data['results']):
+            self.assertEqual(result['status'], status.HTTP_200_OK)
+            self.assertEqual(result['data'], self.search(**params).data)
+
+    def test_batch_search_errors(self):
+        self.create_search_items()
+
+        response = self.batch_search({'queries': [
+            {'name': "Found", 'scope': "bad_scope"},
+            {'name': "F"},
+            {'name': "Found", 'scope': "communities"},
+        ]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        bad_scope, short_name, communities = response.data['results']
+        self.assertEqual(bad_scope, {
+            'status': status.HTTP_400_BAD_REQUEST, 'data': {'detail': "Unexpected scope: bad_scope"}
+        })
+        self.assertEqual(short_name['status'], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(communities['status'], status.HTTP_200_OK)
+        self.assertEqual(self.get_uuids(communities['data']['found_items']), [self.found_community.uuid_str()])
+
+    def test_bad_batch(self):
+        for data, detail in (
+            ({}, "Expected a list of queries"),
+            ({'queries': []}, "Expected a list of queries"),
+            ({'queries': [{'name': "Found"}] * 11}, "At most 10 queries are allowed"),
+            ({'queries': ["Found"]}, "Invalid query: 0"),
+            ({'queries': [{'name': "Found", 'stream': 1}]}, "Unexpected parameter: stream"),
+        ):
+            response = self.batch_search(data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data, {'detail': detail})
+
+    def test_batch_search_requires_authentication(self):
+        request = APIRequestFactory().post('/', {'queries': [{'name': "Found"}]}, format='json')
+        response = CommonSearchBatchAPI.as_view()(request)
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+
+class SearchInstrumentationTest(CommonSearchAPITestMixin, TestCase):
+
+    def test_server_timing(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        server_timing = response['Server-Timing']
+        for scope in CommonSearchAPI.SCOPES:
+            for phase in ('filter', 'query', 'serialize'):
+                self.assertIn('{}-{};dur='.format(scope, phase), server_timing)
+        self.assertTrue(server_timing.split('video-query;')[1].split(';desc=')[1].startswith('"1 sql,'))
+        self.assertIn('total;dur=', server_timing)
+        # The default backend searches scope by scope.
+        self.assertNotIn('all-query;', server_timing)
+
+    @override_settings(SEARCH_SERVER_TIMING=False)
+    def test_server_timing_off(self):
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(SEARCH_METRICS_SINK=InMemoryMetricsSink)
+    def test_metrics_sink(self):
+        self.create_search_items()
+        self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        sink = get_metrics_sink()
+        sink.counters.clear()
+        response = self.search(name="Found", scope="video", limit=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        tags = (('phase', 'query'), ('scope', 'video'))
+        self.assertEqual(sink.counters[('search.phase.sql_count', tags)], 1)
+        self.assertEqual(sink.counters[('search.phase.rows', tags)], 2)
+        tags = (('phase', 'count'), ('scope', 'video'))
+        self.assertEqual(sink.counters[('search.phase.sql_count', tags)], 1)
+        self.assertIn('search.request.duration', [name for name, value, tags in sink.timings])
+
+
+@override_settings(
+    SEARCH_QUERY_LOG_SAMPLE_RATE=1, SEARCH_QUERY_LOG_FLUSH_SIZE=100, SEARCH_QUERY_LOG_FLUSH_INTERVAL=3600
+)
+class SearchQueryLogTest(CommonSearchAPITestMixin, TestCase):
+
+    def setUp(self):
+        super(SearchQueryLogTest, self).setUp()
+        get_query_log_buffer().drain()
+        get_result_cache().clear()
+        caches['default'].clear()
+
+    def test_query_log(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        self.search(name=" fOUND ", scope="video")
+        self.search(name="Found", scope="profiles", scope_2="friends")
+        response = self.search(name="Found")
+        self.search(name="F")
+        self.assertEqual(SearchQueryLog.objects.count(), 0)
+
+        self.assertEqual(flush_query_log(), 3)
+        video, profiles, all_scopes = SearchQueryLog.objects.order_by('pk')
+        self.assertEqual((video.name, video.scope, video.scope_2, video.result_count), ("found", "video", "", 1))
+        self.assertIsNone(video.cache_hit)
+        self.assertEqual((profiles.scope, profiles.scope_2), ("profiles", "friends"))
+        self.assertEqual(all_scopes.scope, "")
+        self.assertEqual(all_scopes.result_count, sum(
+            response.data['found_{}_count'.format(scope)] for scope in CommonSearchAPI.SCOPES
+        ))
+        self.assertGreater(all_scopes.duration, 0)
+
+        with override_settings(SEARCH_QUERY_LOG_FLUSH_SIZE=1):
+            self.search(name="Found", scope="video")
+        self.assertEqual(SearchQueryLog.objects.count(), 4)
+
+    @override_settings(SEARCH_QUERY_LOG_SAMPLE_RATE=0)
+    def test_query_log_off(self):
+        self.c.login(username=self.user01.username, password='111')
+
+        self.search(name="Found", scope="video")
+        self.assertEqual(flush_query_log(), 0)
+
+    def test_query_log_buffer_keeps_latest(self):
+        buffer = QueryLogBuffer(2)
+        for entry in range(3):
+            buffer.append(entry)
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.drain(), [1, 2])
+        self.assertEqual(len(buffer), 0)
+
+    @override_settings(SEARCH_CACHE_TIMEOUT=60)
+    def test_hot_queries_prewarm(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        for i in range(2):
+            self.search(name="Found", scope="video")
+        self.search(name="Found")
+        self.search(name="Other", scope="communities")
+        flush_query_log()
+        self.assertEqual(
+            [(query['name'], query['scope'], query['hits'], query['cache_hits']) for query in get_hot_queries(2)],
+            [("found", "video", 2, 1), ("found", "", 1, 0)]
+        )
+
+        get_result_cache().clear()
+        out = StringIO()
+        call_command('search_hot_queries', top=2, prewarm=True, stdout=out)
+        self.assertIn("'found' scope=video", out.getvalue())
+        self.assertNotIn("'other'", out.getvalue())
+        self.assertIn("6 result cache entries pre-warmed", out.getvalue())
+
+        for params in ({'name': "Found", 'scope': "video"}, {'name': "Found", 'scope': "audio"}):
+            with CaptureQueriesContext(connection) as context:
+                response = self.search(**params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.get_search_statements(context, "Found"), [])
+
+    def test_prewarm_without_result_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('search_hot_queries', prewarm=True, stdout=StringIO())
+
+
+class SearchBenchmarkTest(TestCase):
+
+    def test_benchmark_reports_every_combination(self):
+        viewer = seed_search_data({
+            'users': 6, 'communities': 3, 'items': 3, 'posts': 3, 'friends': 2, 'followeds': 1, 'followers': 1
+        })
+
+        reports = run_search_benchmark(viewer, ['found'], repeat=2)
+
+        self.assertEqual(len(reports), len(SCOPE_COMBINATIONS))
+        for report in reports:
+            self.assertEqual(report['status'], status.HTTP_200_OK)
+            self.assertEqual(report['requests'], 2)
+            self.assertGreater(report['queries'], 0)
+            self.assertLessEqual(report['p50_ms'], report['max_ms'])
+
+
+class SearchQueryTest(SimpleTestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  Found \t User "), "found user")
+        self.assertEqual(normalize("\uff26\uff4f\uff55\uff4e\uff44"), "found")
+        self.assertEqual(normalize("Stra\u00dfe"), "strasse")
+        # What goes to the database is lowercased the way LOWER() does it.
+        self.assertEqual(normalize("Stra\u00dfe", casefold=False), "stra\u00dfe")
+        self.assertEqual(normalize(None), "")
+
+    def test_normalize_folds_mixed_scripts(self):
+        # Cyrillic е and о in a Latin word, Latin a in a Cyrillic one.
+        self.assertEqual(normalize("Us\u0435r F\u043eund"), "user found")
+        self.assertEqual(normalize("\u041ca\u0448a"), "\u043c\u0430\u0448\u0430")
+        # Words of a single script are left alone, even when next to each other.
+        self.assertEqual(normalize("Ivan-\u041f\u0435\u0442\u0440"), "ivan-\u043f\u0435\u0442\u0440")
+
+    def test_parse_query(self):
+        query = parse_query("  Found   USER ")
+        self.assertEqual(query.text, "found user")
+        self.assertEqual(query.tokens, ("found", "user"))
+        self.assertEqual(parse_query("STRASSE Stra\u00dfe").tokens, ("strasse", "stra\u00dfe"))
+
+        with self.assertRaises(BadRequest):
+            parse_query(None)
+        with self.assertRaises(BadRequest):
+            parse_query(" f ")
+        with override_settings(SEARCH_MIN_QUERY_LENGTH=1):
+            self.assertEqual(parse_query(" F ").tokens, ("f",))
+        self.assertEqual(parse_query(" F ", min_length=1).tokens, ("f",))
+
+
+class SearchMigrationTest(SimpleTestCase):
+
+    def test_dependencies_exist(self):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        label = global_apps.get_containing_app_config(__name__).label
+        migrations = [migration for key, migration in loader.disk_migrations.items() if key[0] == label]
+        self.assertTrue(migrations)
+        for migration in migrations:
+            for dependency in migration.dependencies:
+                self.assertIn(dependency, loader.disk_migrations)
+
+
+class LocalLRUCacheTest(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LocalLRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expires(self):
+        cache = LocalLRUCache(max_entries=2)
+        with mock.patch('time.time', return_value=1000):
+            cache.set('a', 1, timeout=10)
+        with mock.patch('time.time', return_value=1009):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('time.time', return_value=1010):
+            self.assertIsNone(cache.get('a'))
+
+
+class StreamingSearchAPITest(CommonSearchAPITestMixin, TestCase):
+
+    def get_streamed_data(self, response):
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(b''.join(response.streaming_content).decode())
+
+    def test_stream_matches_list(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        for params in ({}, {'scope': 'profiles'}, {'scope': 'posts'}, {'scope': 'video', 'fields': 'uuid,title'}):
+            response = self.search(name="Fo", **params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            streamed_response = self.search(name="Fo", stream=1, **params)
+            self.assertEqual(streamed_response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.get_streamed_data(streamed_response), json.loads(response.content.decode()))
+
+    def test_stream_all_pages(self):
+        self.c.login(username=self.user01.username, password='111')
+        items = self.create_video_items(25)
+
+        response = self.search(name="Found", scope="video", stream=1, limit=2)
+        data = self.get_streamed_data(response)
+        self.assertEqual(self.get_uuids(data['found_items']), [i.uuid_str() for i in reversed(items)])
+        self.assertEqual(data['found_items_count'], 25)
+        self.assertIsNone(data['found_items_next_cursor'])
+
+    def test_stream_keeps_statuses_of_one_batch(self):
+        for i in range(3):
+            create_user_with_profile('found_user{}@test.com'.format(i), first_name="Found", last_name="User")
+
+        self.c.login(username=self.user01.username, password='111')
+
+        status_counts = []
+        load_statuses = SocialGraph.load_statuses
+
+        def load_and_count(social_graph, user_ids):
+            load_statuses(social_graph, user_ids)
+            status_counts.append(len(social_graph.statuses))
+
+        with mock.patch.object(SocialGraph, 'load_statuses', load_and_count), mock.patch.object(
+            views, 'prefetch_batches', lambda rows, prefetch: prefetch_batches(rows, prefetch, batch_size=1)
+        ):
+            data = self.get_streamed_data(self.search(name="Found", scope="profiles", stream=1))
+        self.assertGreater(data['found_items_count'], 1)
+        self.assertEqual(status_counts, [1] * data['found_items_count'])
+
+    def test_stream_errors_before_streaming(self):
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", stream=1, video_fields='uuid,unknown')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.streaming)
+
+    def test_stream_flag(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        for value in ('1', 'true', 'True'):
+            self.assertTrue(self.search(name="Found", stream=value).streaming)
+        for value in ('0', 'false', 'False', ''):
+            response = self.search(name="Found", stream=value)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(response.streaming)
+            self.assertEqual(self.get_uuids(response.data['found_video']), [self.found_video_item.uuid_str()])
+
+        response = self.search(name="Found", stream="maybe")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'detail': "Invalid stream: maybe"})
+
+
+@override_settings(SEARCH_BACKGROUND_REBUILDS=False)
+class SuggestSearchAPITest(CommonSearchAPITestMixin, TestCase):
+
+    def setUp(self):
+        super(SuggestSearchAPITest, self).setUp()
+        patcher = mock.patch.object(suggest, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_suggest(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name=" fO", suggest=5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'suggestions': {
+                'profiles': [{'uuid': self.found_userp.uuid_str(), 'label': "Found User"}],
+                'communities': [{'uuid': self.found_community.uuid_str(), 'label': "Found community"}],
+                'video': [{'uuid': self.found_video_item.uuid_str(), 'label': "Found video"}],
+                'audio': [{'uuid': self.found_audio_item.uuid_str(), 'label': "Found audio"}],
+                'text': [{'uuid': self.found_text_item.uuid_str(), 'label': "Found text"}],
+                'posts': [{'uuid': self.found_post.uuid_str(), 'label': "Found post"}],
+            }
+        })
+
+        response = self.search(name="us", scope="profiles", suggest=5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get_uuids(response.data['suggestions']['profiles']),
+            [self.found_userp.uuid_str(), self.other_userp.uuid_str()]
+        )
+
+    def test_suggest_first_keystroke(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="F", scope="video", suggest=5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'suggestions': {
+                'video': [{'uuid': self.found_video_item.uuid_str(), 'label': "Found video"}],
+            }
+        })
+
+        response = self.search(name="F", scope="video")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_suggest_profiles_scope_2(self):
+        self.create_search_items()
+        found_friend_user, found_friend_userp = create_user_with_profile(
+            'found_friend_user@test.com',
+            first_name="Found Friend",
+            last_name="User"
+        )
+        self.user01p.friend_user(found_friend_user)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="profiles", suggest=5)
+        self.assertEqual(len(response.data['suggestions']['profiles']), 2)
+        self.assertTrue(suggest.get_suggest_index().complete)
+
+        response = self.search(name="Found", scope="profiles", scope_2="friends", suggest=5)
+        self.assertEqual(response.data, {
+            'suggestions': {
+                'profiles': [{'uuid': found_friend_userp.uuid_str(), 'label': "Found Friend User"}],
+            }
+        })
+
+    def test_suggest_ranking(self):
+        self.create_search_items()
+        lost_community = Community.objects.create(
+            name="Lost and found",
+            subject=self.community_subject,
+            author=self.user01
+        )
+        fountain_community = Community.objects.create(
+            name="Fountain",
+            subject=self.community_subject,
+            author=self.user01
+        )
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Fo", scope="communities", suggest=2)
+        self.assertEqual(
+            self.get_uuids(response.data['suggestions']['communities']),
+            [fountain_community.uuid_str(), self.found_community.uuid_str()]
+        )
+        response = self.search(name="Found", scope="communities", suggest=5)
+        self.assertEqual(
+            self.get_uuids(response.data['suggestions']['communities']),
+            [self.found_community.uuid_str(), lost_community.uuid_str()]
+        )
+
+    def test_suggest_follows_saves_and_deletes(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Foun", scope="communities", suggest=5)
+        self.assertEqual(len(response.data['suggestions']['communities']), 1)
+
+        fountain_community = Community.objects.create(
+            name="Fountain",
+            subject=self.community_subject,
+            author=self.user01
+        )
+        response = self.search(name="Foun", scope="communities", suggest=5)
+        self.assertEqual(
+            self.get_uuids(response.data['suggestions']['communities']),
+            [fountain_community.uuid_str(), self.found_community.uuid_str()]
+        )
+
+        self.found_community.delete()
+        response = self.search(name="Foun", scope="communities", suggest=5)
+        self.assertEqual(
+            self.get_uuids(response.data['suggestions']['communities']),
+            [fountain_community.uuid_str()]
+        )
+
+    def test_suggest_follows_other_processes(self):
+        self.create_search_items()
+        lost_community = Community.objects.create(
+            name="Lost and found",
+            subject=self.community_subject,
+            author=self.user01
+        )
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="communities", suggest=1)
+        self.assertEqual(
+            self.get_uuids(response.data['suggestions']['communities']), [self.found_community.uuid_str()]
+        )
+
+        # Deleted in another process, which leaves the index here as it was.
+        with mock.patch.object(signals, 'remove_from_suggest_index'):
+            self.found_community.delete()
+        with mock.patch.object(suggest.SuggestIndex, 'build', wraps=suggest.SuggestIndex.build) as build:
+            response = self.search(name="Found", scope="communities", suggest=1)
+        self.assertFalse(build.called)
+        self.assertEqual(self.get_uuids(response.data['suggestions']['communities']), [lost_community.uuid_str()])
+
+    def test_suggest_index_build(self):
+        self.create_search_items()
+
+        index = suggest.SuggestIndex.build(1000)
+        self.assertTrue(index.complete)
+        for scope, entries in index.entries.items():
+            self.assertEqual(entries, sorted(entries))
+        self.assertIn(("found video", self.found_video_item.uuid_str()), index.entries['video'])
+        self.assertIn(("video", self.found_video_item.uuid_str()), index.entries['video'])
+
+    @override_settings(SEARCH_SUGGEST_MAX_ENTRIES=1)
+    def test_suggest_over_memory_budget(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", scope="video", suggest=5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(suggest.get_suggest_index().complete)
+        self.assertEqual(response.data, {
+            'suggestions': {
+                'video': [{'uuid': self.found_video_item.uuid_str(), 'label': "Found video"}],
+            }
+        })
+
+
+@override_settings(SEARCH_CONCURRENT_WORKERS=6)
+class ConcurrentSearchAPITest(CommonSearchAPITestMixin, TransactionTestCase):
+
+    def test_all_search(self):
+        self.create_search_items()
+        self.create_video_items(2)
+
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", video_limit=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with override_settings(SEARCH_CONCURRENT_WORKERS=None):
+            sequential_response = self.search(name="Found", video_limit=2)
+        self.assertEqual(response.data, sequential_response.data)
+        self.assertEqual(response.data['found_video_count'], 3)
+
+    def test_all_search_shares_social_graph(self):
+        self.create_search_items()
+
+        self.c.login(username=self.user01.username, password='111')
+
+        with mock.patch.object(views, 'SocialGraph', wraps=SocialGraph) as social_graph:
+            response = self.search(name="Found", scope_2="friends")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(social_graph.call_count, 1)
+
+    def test_all_search_error(self):
+        self.c.login(username=self.user01.username, password='111')
+
+        response = self.search(name="Found", video_cursor="bad_cursor")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'detail': "Invalid cursor"
+        })
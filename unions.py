@@ -0,0 +1,48 @@
+from collections import OrderedDict
+
+from django.db import connections
+
+
+def execute_union(parts, using):
+    """
+    Runs the (sql, params) parts as one UNION ALL statement. Every part is
+    wrapped in a subquery of its own, so its ORDER BY and LIMIT apply to it
+    alone.
+    """
+    sql = ' UNION ALL '.join(part_sql for part_sql, part_params in parts)
+    params = [param for part_sql, part_params in parts for param in part_params]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def union_pages(querysets, limits, orderings):
+    """
+    Fetches the first limits[key] + 1 rows of every queryset of the
+    querysets OrderedDict, in the order of orderings[key], in one statement.
+
+    Returns an OrderedDict of lists of the values of the ordering fields of
+    every row; orderings end with 'pk', so the last value is the primary key.
+    """
+    parts = []
+    for key, queryset in querysets.items():
+        names = [field.lstrip('-') for field in orderings[key]]
+        sql, params = queryset.order_by(*orderings[key]).values_list(*names)[:limits[key] + 1].query.sql_with_params()
+        parts.append(("SELECT %s, page.* FROM ({}) page".format(sql), (key,) + tuple(params)))
+
+    pages = OrderedDict((key, []) for key in querysets)
+    for row in execute_union(parts, next(iter(querysets.values())).db):
+        pages[row[0]].append(row[1:])
+    return pages
+
+
+def union_counts(querysets):
+    """
+    Counts the rows of every queryset of the querysets dict, usually the
+    ones of counts.get_counted_queryset(), in one statement.
+    """
+    parts = []
+    for key, queryset in querysets.items():
+        sql, params = queryset.query.sql_with_params()
+        parts.append(("SELECT %s, COUNT(*) FROM ({}) counted".format(sql), (key,) + tuple(params)))
+    return dict(execute_union(parts, next(iter(querysets.values())).db))
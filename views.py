@@ -1,28 +1,51 @@
-from django.db.models import Q
+import copy
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import QueryDict, StreamingHttpResponse
 from rest_framework import generics
+from rest_framework.exceptions import APIException
+from rest_framework.fields import BooleanField
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status
 
 from apps.api.exceptions import BadRequest
-from apps.api.filters import CommonProfileFilter, CommonCommunityFilter, CommonAudioFilter, CommonVideoFilter, \
-    CommonTextFilter
 from apps.communities.models import Community
 from apps.communities.api.serializers import CommunityBriefSerializer
 from apps.galleries.api.serializers import VideoItemBriefSerializer, AudioItemBriefSerializer, TextItemBriefSerializer
-from apps.galleries.models import VideoItem, AudioItem, TextItem
 from apps.posts.api.serializers import PostSerializer
 from apps.posts.models import Post
-from apps.userprofile.api.serializers import UserProfileRelationsBriefSerializer
 from apps.userprofile.models import UserProfile
 
+from .backends import get_search_backend
+from .cache import (
+    etag_matches, get_result_cache, get_result_cache_timeout, get_versions, make_etag, make_result_cache_key
+)
+from .counts import COUNT_STRATEGIES, count_queryset, get_count, get_counted_queryset
+from .executors import map_concurrently
+from .metrics import NullMetrics, SearchMetrics, get_metrics_sink
+from .pagination import KeysetPaginator
+from .query import parse_query
+from .querylog import log_query, should_log_query
+from .scopes import GALLERY_SCOPES, ORDERING_BY_SCOPE, SEARCH_FIELDS_BY_SCOPE, get_label, get_visible_queryset
+from .serializers import SearchProfileSerializer
+from .social import SocialGraph
+from .streaming import ITERATOR_CHUNK_SIZE, iterate_queryset, prefetch_batches, stream_sections
+from .suggest import get_suggest_index, get_visible_suggestions
+from .unions import union_counts, union_pages
+
 
 class CommonSearchAPI(generics.ListAPIView):
 
     permission_classes = (IsAuthenticated,)
 
+    SCOPES = ('profiles', 'communities', 'video', 'audio', 'text', 'posts')
+
     SERIALIZER_CLASSES_BY_SCOPE = {
-        'profiles': UserProfileRelationsBriefSerializer,
+        'profiles': SearchProfileSerializer,
         'communities': CommunityBriefSerializer,
         'video': VideoItemBriefSerializer,
         'audio': AudioItemBriefSerializer,
@@ -30,101 +53,666 @@ class CommonSearchAPI(generics.ListAPIView):
         'posts': PostSerializer,
     }
 
+    PREVIEW_COUNT_LIMIT = 100
+    SUGGEST_MAX_LIMIT = 20
+
+    # Post bodies and attached media are left out of search results unless asked for.
+    DEFAULT_FIELDS_BY_SCOPE = {
+        'posts': (
+            'uuid', 'date_created', 'author', 'title', 'is_liked', 'comments_count', 'likes_count', 'reposts_count'
+        ),
+    }
+
+    # Columns only read by the serializer field of the same name, and so not
+    # fetched when that field is not requested.
+    DEFERRABLE_FIELDS_BY_SCOPE = {
+        'video': ('description', 'source_title', 'source_description'),
+        'audio': ('description',),
+        'text': ('description',),
+        'posts': ('text',),
+    }
+
+    # Parameters an unscoped search can have and still be answered by one
+    # grouped query, along with <scope>_limit and <scope>_fields.
+    GROUPED_SEARCH_PARAMS = ('name', 'scope', 'preview', 'limit', 'fields', 'count', 'stream')
+
+    ORDERING_BY_SCOPE = ORDERING_BY_SCOPE
+
+    def get_min_query_length(self):
+        # Suggestions are asked for from the first keystroke on.
+        return 1 if self.request.query_params.get('suggest') else None
+
+    def get_query(self):
+        if not hasattr(self, '_query'):
+            self._query = parse_query(self.request.query_params.get('name'), self.get_min_query_length())
+        return self._query
+
     def get_filter_dict(self):
-        name = self.request.query_params.get('name')
         filter_dict = self.request.GET.copy()
-        filter_dict['name'] = name
+        filter_dict['name'] = self.get_query().text
         return filter_dict
 
     def get_serializer(self, key, *args, **kwargs):
         serializer_class = self.SERIALIZER_CLASSES_BY_SCOPE.get(key)
         if serializer_class is None:
             raise BadRequest("Unexpected scope: {}".format(key))
+        fields = kwargs.pop('fields', None)
         kwargs['context'] = self.get_serializer_context()
-        return serializer_class(*args, **kwargs)
+        if key == 'profiles':
+            kwargs['context']['social_graph'] = self.get_social_graph()
+        serializer = serializer_class(*args, **kwargs)
+        if fields is not None:
+            child = serializer.child if kwargs.get('many') else serializer
+            unexpected = [name for name in fields if name not in child.fields]
+            if unexpected:
+                raise BadRequest("Unexpected field: {}".format(unexpected[0]))
+            for name in list(child.fields):
+                if name not in fields:
+                    child.fields.pop(name)
+        return serializer
+
+    def get_fields(self, scope, prefix=''):
+        """
+        The serializer fields requested with `fields` (or `<scope>_fields`),
+        the lean default of the scope when there is none, or None for all.
+        """
+        fields = self.request.query_params.get('{}fields'.format(prefix))
+        if not fields:
+            return self.DEFAULT_FIELDS_BY_SCOPE.get(scope)
+        if fields == 'all':
+            return None
+        return tuple(name.strip() for name in fields.split(',') if name.strip())
+
+    def project_queryset(self, scope, queryset, fields):
+        if fields is None:
+            return queryset
+        deferred = [name for name in self.DEFERRABLE_FIELDS_BY_SCOPE.get(scope, ()) if name not in fields]
+        return queryset.defer(*deferred) if deferred else queryset
+
+    def get_social_graph(self):
+        if not hasattr(self, '_social_graph'):
+            self._social_graph = SocialGraph(self.request.user)
+        return self._social_graph
+
+    def load_statuses(self, rows):
+        self.get_social_graph().load_statuses([row.user_id for row in rows])
+
+    def get_search_backend(self):
+        if not hasattr(self, '_search_backend'):
+            self._search_backend = get_search_backend()
+        return self._search_backend
+
+    def search_queryset(self, scope, queryset):
+        return self.get_search_backend().filter_queryset(scope, queryset, self.get_filter_dict())
 
     def get_profiles_queryset(self):
         queryset = UserProfile.objects.all()
         scope_2 = self.request.query_params.get('scope_2')
         if scope_2:
-            queryset = {
-                'friends': queryset.filter(
-                    user__in=self.request.user.userprofile.friends.all()
-                ),
-                'others': queryset.exclude(
-                    Q(user__in=self.request.user.userprofile.friends.all()) |
-                    Q(user=self.request.user)
-                ),
-                'followeds': queryset.filter(
-                    user__in=self.request.user.userprofile.followed.all()
-                ).exclude(
-                    user__in=self.request.user.userprofile.friends.all()
-                ),
-                'followers': self.request.user.followers.all().exclude(
-                    user__in=self.request.user.userprofile.friends.all()
-                )
-            }.get(scope_2)
-            if queryset is None:
+            social_graph = self.get_social_graph()
+            if scope_2 == 'friends':
+                queryset = queryset.filter(user__in=social_graph.friend_ids)
+            elif scope_2 == 'others':
+                queryset = queryset.exclude(user__in=social_graph.friend_ids | {self.request.user.pk})
+            elif scope_2 == 'followeds':
+                queryset = queryset.filter(user__in=social_graph.followed_ids - social_graph.friend_ids)
+            elif scope_2 == 'followers':
+                queryset = queryset.filter(user__in=social_graph.follower_ids - social_graph.friend_ids)
+            else:
                 raise BadRequest("Unexpected scope_2: {}".format(scope_2))
 
-        return CommonProfileFilter(self.get_filter_dict(), queryset=queryset).qs
+        return self.search_queryset('profiles', queryset)
 
     def get_communities_queryset(self):
-        queryset = Community.objects.not_deleted()
-        return CommonCommunityFilter(self.get_filter_dict(), queryset=queryset).qs
+        return self.search_queryset('communities', Community.objects.not_deleted())
+
+    def get_gallery_queryset(self, scope):
+        return self.search_queryset(scope, get_visible_queryset(scope))
 
     def get_video_queryset(self):
-        return CommonVideoFilter(
-            self.get_filter_dict(), queryset=VideoItem.objects.visible_to_all()
-        ).qs.order_by('-date_created')
+        return self.get_gallery_queryset('video')
 
     def get_audio_queryset(self):
-        return CommonAudioFilter(
-            self.get_filter_dict(), queryset=AudioItem.objects.visible_to_all()
-        ).qs.order_by('-date_created')
+        return self.get_gallery_queryset('audio')
 
     def get_text_queryset(self):
-        return CommonTextFilter(
-            self.get_filter_dict(), queryset=TextItem.objects.visible_to_all()
-        ).qs.order_by('-date_created')
+        return self.get_gallery_queryset('text')
 
     def get_posts_queryset(self):
-        return Post.objects.not_deleted().filter(
-            title__istartswith=self.request.query_params.get('name')
+        return self.search_queryset('posts', Post.objects.not_deleted())
+
+    def get_concurrent_workers(self):
+        return getattr(settings, 'SEARCH_CONCURRENT_WORKERS', None)
+
+    def get_int_param(self, name, maximum):
+        value = self.request.query_params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            raise BadRequest("Invalid {}: {}".format(name, value))
+        if not 0 < value <= maximum:
+            raise BadRequest("{} must be between 1 and {}".format(name.capitalize(), maximum))
+        return value
+
+    def get_bool_param(self, name):
+        value = self.request.query_params.get(name)
+        if value in (None, '') or value in BooleanField.FALSE_VALUES:
+            return False
+        if value in BooleanField.TRUE_VALUES:
+            return True
+        raise BadRequest("Invalid {}: {}".format(name, value))
+
+    def get_preview(self):
+        return self.get_int_param('preview', KeysetPaginator.max_limit)
+
+    def get_paginator(self, scope, prefix='', preview=None):
+        ordering = self.get_search_backend().get_ordering(scope, self.ORDERING_BY_SCOPE[scope])
+        if preview:
+            return KeysetPaginator(ordering, limit=preview)
+        return KeysetPaginator(
+            ordering,
+            limit=self.request.query_params.get('{}limit'.format(prefix)),
+            cursor=self.request.query_params.get('{}cursor'.format(prefix))
+        )
+
+    def get_count_strategy(self, preview=None):
+        """
+        The `count` strategy of the request and its threshold: previews are
+        capped at PREVIEW_COUNT_LIMIT, everything else follows
+        SEARCH_COUNT_STRATEGY and SEARCH_COUNT_THRESHOLD unless asked otherwise.
+        """
+        strategy = self.request.query_params.get('count')
+        if not strategy:
+            strategy = 'capped' if preview else getattr(settings, 'SEARCH_COUNT_STRATEGY', 'exact')
+        if strategy not in COUNT_STRATEGIES:
+            raise BadRequest("Unexpected count: {}".format(strategy))
+        threshold = self.PREVIEW_COUNT_LIMIT if preview else getattr(settings, 'SEARCH_COUNT_THRESHOLD', 1000)
+        return strategy, threshold
+
+    def get_metrics(self):
+        if not hasattr(self, '_metrics'):
+            self._metrics = SearchMetrics() if getattr(settings, 'SEARCH_INSTRUMENTATION', True) else NullMetrics()
+        return self._metrics
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(CommonSearchAPI, self).finalize_response(request, response, *args, **kwargs)
+        metrics = getattr(self, '_metrics', None)
+        if isinstance(metrics, SearchMetrics):
+            if getattr(settings, 'SEARCH_SERVER_TIMING', True):
+                response['Server-Timing'] = metrics.get_server_timing()
+            sink = get_metrics_sink()
+            if sink is not None:
+                metrics.emit(sink)
+        return response
+
+    def can_page_in_backend(self, scope):
+        """
+        Whether the search backend pages its own hits and the request has no
+        parameters that filter `scope` beyond its name.
+        """
+        if not self.get_search_backend().pages_hits:
+            return False
+        allowed = set(self.GROUPED_SEARCH_PARAMS + ('cursor',))
+        allowed.update(
+            '{}_{}'.format(key, param) for key in self.SCOPES for param in ('limit', 'cursor', 'fields')
+        )
+        if scope != 'profiles':
+            # Only profiles are filtered by it.
+            allowed.add('scope_2')
+        return all(key in allowed for key in self.request.query_params)
+
+    def get_paged_scope_hits(self, scope, paginator, preview=None, fields=None):
+        """
+        The hits of a scope the search backend pages and counts by itself, or
+        None when the backend or the parameters of the request need the
+        queryset of the scope.
+        """
+        if not self.can_page_in_backend(scope):
+            return None
+
+        hits = self.get_search_backend().get_page_hits(scope, self.get_filter_dict(), paginator)
+        if hits is None:
+            return None
+        with self.get_metrics().measure(scope, 'query') as measurement:
+            rows = self.get_rows(scope, hits['pks'][:paginator.limit], fields)
+            measurement.rows = len(rows)
+        count_strategy, count_threshold = self.get_count_strategy(preview)
+        count_is_exact = count_strategy != 'capped' or hits['count'] <= count_threshold
+        return {
+            'rows': rows,
+            'count': hits['count'] if count_is_exact else count_threshold,
+            'count_is_exact': count_is_exact,
+            'next_cursor': paginator.encode_cursor(rows[-1]) if len(hits['pks']) > paginator.limit and rows else None
+        }
+
+    def get_scope_hits(self, scope, paginator, preview=None, fields=None):
+        hits = self.get_paged_scope_hits(scope, paginator, preview, fields)
+        if hits is not None:
+            return hits
+
+        metrics = self.get_metrics()
+        with metrics.measure(scope, 'filter'):
+            queryset = getattr(self, 'get_{}_queryset'.format(scope))()
+        with metrics.measure(scope, 'query') as measurement:
+            rows, next_cursor = paginator.paginate_queryset(self.project_queryset(scope, queryset, fields))
+            measurement.rows = len(rows)
+
+        count_is_exact = True
+        if paginator.cursor is None and next_cursor is None:
+            count = len(rows)
+        else:
+            with metrics.measure(scope, 'count'):
+                count, count_is_exact = count_queryset(queryset, *self.get_count_strategy(preview))
+        return {
+            'rows': rows,
+            'count': count,
+            'count_is_exact': count_is_exact,
+            'next_cursor': next_cursor
+        }
+
+    def get_cache_key(self, scope, paginator, preview=None):
+        ignored = {'name', 'scope', 'preview', 'limit', 'cursor', 'fields', 'count', 'stream'}
+        ignored.update(
+            '{}_{}'.format(key, param) for key in self.SCOPES for param in ('limit', 'cursor', 'fields')
+        )
+        params = dict(
+            (key, self.request.query_params.getlist(key)) for key in self.request.query_params if key not in ignored
+        )
+        # Spellings of the same query share their cache entries.
+        params['name'] = self.get_query().text
+        params['limit'] = paginator.limit
+        params['cursor'] = paginator.cursor
+        params['count'] = self.get_count_strategy(preview)
+        params['backend'] = type(self.get_search_backend()).__name__
+        version_names = ['scope:{}'.format(scope)]
+        if scope == 'profiles':
+            # scope_2 filters on the viewer's relationships.
+            params['user'] = self.request.user.pk
+            version_names.append('user:{}'.format(self.request.user.pk))
+        return make_result_cache_key(scope, get_versions(version_names), params)
+
+    def get_etag(self, scope=None):
+        """
+        The data versions of the searched scopes (and the viewer's relationship
+        version when profiles are among them) hashed with the parameters of
+        the request, so that a repeated search is answered with a 304 before
+        any of it runs. Items also carry per-viewer fields the versions do not
+        follow, such as is_liked, so an ETag is only reused within
+        SEARCH_ETAG_TIMEOUT seconds; setting it to None turns ETags off.
+        """
+        timeout = getattr(settings, 'SEARCH_ETAG_TIMEOUT', 300)
+        if not timeout:
+            return None
+        scopes = [scope] if scope else self.SCOPES
+        version_names = ['scope:{}'.format(key) for key in scopes]
+        if 'profiles' in scopes:
+            version_names.append('user:{}'.format(self.request.user.pk))
+        params = dict((key, self.request.query_params.getlist(key)) for key in self.request.query_params)
+        params['name'] = self.get_query().text
+        params['count'] = self.get_count_strategy(None if scope else self.get_preview())
+        params['backend'] = type(self.get_search_backend()).__name__
+        params['user'] = self.request.user.pk
+        params['period'] = int(time.time() // timeout)
+        return make_etag(get_versions(version_names), params)
+
+    def get_rows(self, scope, pks, fields=None):
+        # Hits can come from search documents, the result cache or the snapshot,
+        # all of which may lag behind visibility, so it is checked again here.
+        rows_by_pk = self.project_queryset(scope, get_visible_queryset(scope), fields).in_bulk(pks)
+        return [rows_by_pk[pk] for pk in pks if pk in rows_by_pk]
+
+    def get_cached_scope_hits(self, scope, paginator, preview=None, fields=None):
+        """
+        Caches the primary keys of a page rather than its serialized rows,
+        which carry per-viewer fields such as is_liked.
+        """
+        timeout = get_result_cache_timeout()
+        if not timeout:
+            return self.get_scope_hits(scope, paginator, preview, fields)
+
+        result_cache = get_result_cache()
+        cache_key = self.get_cache_key(scope, paginator, preview)
+        with self.get_metrics().measure(scope, 'cache') as measurement:
+            cached = result_cache.get(cache_key)
+            cache_lookups = getattr(self, '_cache_lookups', None)
+            if cache_lookups is not None:
+                cache_lookups.append(cached is not None)
+            if cached is not None:
+                hits = dict(cached, rows=self.get_rows(scope, cached['pks'], fields))
+                del hits['pks']
+                measurement.rows = len(hits['rows'])
+                return hits
+
+        hits = self.get_scope_hits(scope, paginator, preview, fields)
+        cached = dict(hits, pks=[row.pk for row in hits['rows']])
+        del cached['rows']
+        result_cache.set(cache_key, cached, timeout)
+        return hits
+
+    def iterate_rows(self, scope, pks, fields=None):
+        for start in range(0, len(pks), ITERATOR_CHUNK_SIZE):
+            yield from self.get_rows(scope, pks[start:start + ITERATOR_CHUNK_SIZE], fields)
+
+    def get_stream_section(self, scope, items_key, prefix=''):
+        """
+        Builds everything that can fail up front, so that errors are still
+        reported before the first byte of the response is sent.
+        """
+        fields = self.get_fields(scope, prefix)
+        serializer = self.get_serializer(scope, [], many=True, fields=fields)
+        backend = self.get_search_backend()
+        pks = backend.get_hit_ids(scope, self.get_filter_dict()) if self.can_page_in_backend(scope) else None
+        if pks is not None:
+            rows = self.iterate_rows(scope, pks, fields)
+        else:
+            queryset = self.project_queryset(scope, getattr(self, 'get_{}_queryset'.format(scope))(), fields)
+            rows = iterate_queryset(queryset.order_by(*backend.get_ordering(scope, self.ORDERING_BY_SCOPE[scope])))
+        if scope == 'profiles' and (fields is None or 'status' in fields):
+            rows = prefetch_batches(rows, self.load_statuses)
+        return (
+            items_key,
+            '{}_count'.format('found_items' if prefix == '' else items_key),
+            '{}_next_cursor'.format('found_items' if prefix == '' else items_key),
+            rows,
+            serializer.child.to_representation
+        )
+
+    def stream(self, scope):
+        if scope:
+            sections = [self.get_stream_section(scope, 'found_posts' if scope == 'posts' else 'found_items')]
+        else:
+            sections = [
+                self.get_stream_section(key, 'found_{}'.format(key), prefix='{}_'.format(key)) for key in self.SCOPES
+            ]
+        return StreamingHttpResponse(stream_sections(sections), content_type='application/json')
+
+    def get_scope_result(self, scope, prefix='', preview=None):
+        fields = self.get_fields(scope, prefix)
+        hits = self.get_cached_scope_hits(scope, self.get_paginator(scope, prefix, preview), preview, fields)
+        return self.get_result(scope, hits, fields)
+
+    def get_grouped_scope_results(self, preview=None):
+        """
+        The results of every scope from one grouped query of the search
+        backend, or None when the backend or the parameters of the request
+        need a query per scope.
+        """
+        allowed = set(self.GROUPED_SEARCH_PARAMS)
+        allowed.update('{}_{}'.format(key, param) for key in self.SCOPES for param in ('limit', 'fields'))
+        if any(key not in allowed for key in self.request.query_params):
+            return None
+
+        metrics = self.get_metrics()
+        count_strategy, count_threshold = self.get_count_strategy(preview)
+        paginators = OrderedDict((key, self.get_paginator(key, '{}_'.format(key), preview)) for key in self.SCOPES)
+        with metrics.measure('all', 'query') as measurement:
+            grouped_hits = self.get_search_backend().get_grouped_hits(
+                self.get_filter_dict(), dict((key, paginator.limit) for key, paginator in paginators.items())
+            )
+            if grouped_hits is None:
+                measurement.discarded = True
+                return None
+            measurement.rows = sum(len(hits['pks']) for hits in grouped_hits.values())
+
+        results = []
+        for key, paginator in paginators.items():
+            fields = self.get_fields(key, '{}_'.format(key))
+            pks = grouped_hits[key]['pks']
+            with metrics.measure(key, 'query') as measurement:
+                rows = self.get_rows(key, pks[:paginator.limit], fields)
+                measurement.rows = len(rows)
+            # The values the rows were ranked by, which the next cursor is made of.
+            for row in rows:
+                for name, value in grouped_hits[key].get('annotations', {}).get(row.pk, {}).items():
+                    setattr(row, name, value)
+            # The grouped query counts every hit; only a capped count is cut back.
+            count = grouped_hits[key]['count']
+            count_is_exact = count_strategy != 'capped' or count <= count_threshold
+            results.append(self.get_result(key, {
+                'rows': rows,
+                'count': count if count_is_exact else count_threshold,
+                'count_is_exact': count_is_exact,
+                'next_cursor': paginator.encode_cursor(rows[-1]) if len(pks) > paginator.limit and rows else None
+            }, fields))
+        return results
+
+    def get_gallery_results(self, preview=None):
+        """
+        The results of the gallery scopes from one UNION query for their
+        pages and one for the counts they need, or None when a cursor, the
+        result cache or a search backend that pages its own hits calls for the
+        per-scope path.
+        """
+        params = self.request.query_params
+        if (
+            get_result_cache_timeout() or self.get_search_backend().pages_hits or
+            any('{}_cursor'.format(scope) in params for scope in GALLERY_SCOPES)
+        ):
+            return None
+
+        metrics = self.get_metrics()
+        count_strategy, count_threshold = self.get_count_strategy(preview)
+        querysets, paginators = OrderedDict(), {}
+        for scope in GALLERY_SCOPES:
+            paginators[scope] = self.get_paginator(scope, '{}_'.format(scope), preview)
+            with metrics.measure(scope, 'filter'):
+                querysets[scope] = self.get_gallery_queryset(scope)
+
+        with metrics.measure('gallery', 'query') as measurement:
+            pages = union_pages(
+                querysets,
+                dict((scope, paginator.limit) for scope, paginator in paginators.items()),
+                dict((scope, paginator.ordering) for scope, paginator in paginators.items())
+            )
+            measurement.rows = sum(len(page) for page in pages.values())
+
+        # As on the per-scope path, only scopes with a next page need counting.
+        counted = {}
+        counting = [scope for scope in GALLERY_SCOPES if len(pages[scope]) > paginators[scope].limit]
+        if counting:
+            with metrics.measure('gallery', 'count'):
+                counted = union_counts(dict(
+                    (scope, get_counted_queryset(querysets[scope], count_strategy, count_threshold))
+                    for scope in counting
+                ))
+
+        results = []
+        for scope, paginator in paginators.items():
+            fields = self.get_fields(scope, '{}_'.format(scope))
+            page = pages[scope][:paginator.limit]
+            with metrics.measure(scope, 'query') as measurement:
+                rows = self.get_rows(scope, [values[-1] for values in page], fields)
+                measurement.rows = len(rows)
+            # Annotations the rows were ordered by, such as search_rank, for the next cursor.
+            values_by_pk = dict((values[-1], values) for values in page)
+            for row in rows:
+                for name, value in zip(paginator.get_field_names(), values_by_pk[row.pk]):
+                    if not hasattr(row, name):
+                        setattr(row, name, value)
+
+            if scope in counted:
+                count, count_is_exact = get_count(querysets[scope], counted[scope], count_strategy, count_threshold)
+            else:
+                count, count_is_exact = len(page), True
+            has_next = len(pages[scope]) > paginator.limit and rows
+            results.append(self.get_result(scope, {
+                'rows': rows,
+                'count': count,
+                'count_is_exact': count_is_exact,
+                'next_cursor': paginator.encode_cursor(rows[-1]) if has_next else None
+            }, fields))
+        return results
+
+    def get_result(self, scope, hits, fields=None):
+        with self.get_metrics().measure(scope, 'serialize') as measurement:
+            if scope == 'profiles' and (fields is None or 'status' in fields):
+                self.load_statuses(hits['rows'])
+            items = self.get_serializer(scope, hits['rows'], many=True, fields=fields).data
+            measurement.rows = len(items)
+        return {
+            'items': items,
+            'count': hits['count'],
+            'count_is_exact': hits['count_is_exact'],
+            'next_cursor': hits['next_cursor']
+        }
+
+    def get_suggestions(self, scope, limit):
+        # The index knows nothing of the viewer's relationships scope_2 filters on.
+        index = None if self.request.query_params.get('scope_2') else get_suggest_index()
+        if index is not None and index.complete:
+            return get_visible_suggestions(index, scope, self.get_query().text, limit)
+        rows = getattr(self, 'get_{}_queryset'.format(scope))().values_list('uuid', *SEARCH_FIELDS_BY_SCOPE[scope])
+        return [{'uuid': str(row[0]), 'label': get_label(row[1:])} for row in rows[:limit]]
+
+    def record_query(self, scope, result_count, started):
+        cache_lookups = self._cache_lookups
+        log_query(
+            name=self.get_query().text[:255],
+            scope=scope or '',
+            scope_2=self.request.query_params.get('scope_2', '')[:16],
+            duration=(time.perf_counter() - started) * 1000,
+            result_count=result_count,
+            cache_hit=all(cache_lookups) if cache_lookups else None
         )
 
     def list(self, request, *args, **kwargs):
-        name = self.request.query_params.get('name')
         scope = self.request.query_params.get('scope')
+        if scope and scope not in self.SCOPES:
+            raise BadRequest("Unexpected scope: {}".format(scope))
+        self.get_query()
+
+        suggest = self.get_int_param('suggest', self.SUGGEST_MAX_LIMIT)
+        if suggest:
+            return Response({
+                'suggestions': dict(
+                    (key, self.get_suggestions(key, suggest)) for key in ([scope] if scope else self.SCOPES)
+                )
+            }, status=status.HTTP_200_OK)
+
+        if self.get_bool_param('stream'):
+            return self.stream(scope)
+
+        etag = self.get_etag(scope)
+        if etag is not None and etag_matches(etag, self.request.META.get('HTTP_IF_NONE_MATCH')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        logged = should_log_query()
+        if logged:
+            started = time.perf_counter()
+            self._cache_lookups = []
+
         if scope:
-            if scope not in ['profiles', 'communities', 'video', 'audio', 'text', 'posts']:
-                raise BadRequest("Unexpected scope: {}".format(scope))
-
-            qs_function = getattr(self, 'get_{}_queryset'.format(scope))
-            if scope != 'posts':
-                return Response({
-                    'found_items': self.get_serializer(scope, qs_function(), many=True).data,
-                    'found_items_count': qs_function().count()
-                }, status=status.HTTP_200_OK)
-            else:
-                return Response({
-                    'found_posts': self.get_serializer(
-                        'posts',
-                        Post.objects.not_deleted().filter(title__istartswith=name),
-                        many=True
-                    ).data,
-                    'found_items_count': len(qs_function())
-                }, status=status.HTTP_200_OK)
+            result = self.get_scope_result(scope)
+            data = {
+                'found_posts' if scope == 'posts' else 'found_items': result['items'],
+                'found_items_count': result['count'],
+                'found_items_next_cursor': result['next_cursor']
+            }
+            if self.get_count_strategy()[0] != 'exact':
+                data['found_items_count_is_exact'] = result['count_is_exact']
+            response = Response(data, status=status.HTTP_200_OK)
+            result_count = result['count']
         else:
+            preview = self.get_preview()
+            count_strategy = self.get_count_strategy(preview)[0]
+            results = self.get_grouped_scope_results(preview)
+            if results is None:
+                results_by_scope = {}
+                gallery_results = self.get_gallery_results(preview)
+                if gallery_results is not None:
+                    results_by_scope.update(zip(GALLERY_SCOPES, gallery_results))
+                scopes = [key for key in self.SCOPES if key not in results_by_scope]
+                # The scopes share these, so they are created before the
+                # workers can race to create their own.
+                self.get_metrics()
+                self.get_search_backend()
+                if 'profiles' in scopes:
+                    self.get_social_graph()
+                results_by_scope.update(zip(scopes, map_concurrently(
+                    self.get_scope_result,
+                    [(key, '{}_'.format(key), preview) for key in scopes],
+                    max_workers=self.get_concurrent_workers()
+                )))
+                results = [results_by_scope[key] for key in self.SCOPES]
             kwargs = {}
-            for key in ['profiles', 'communities', 'video', 'audio', 'text']:
-                qs_function = getattr(self, 'get_{}_queryset'.format(key))
-                kwargs['found_{}'.format(key)] = self.get_serializer(key, qs_function(), many=True).data
-                kwargs['found_{}_count'.format(key)] = qs_function().count()
-            kwargs['found_posts'] = self.get_serializer(
-                'posts',
-                self.get_posts_queryset(),
-                many=True
-            ).data
-            kwargs['found_posts_count'] = self.get_posts_queryset().count()
-            return Response(kwargs, status=status.HTTP_200_OK)
+            for key, result in zip(self.SCOPES, results):
+                kwargs['found_{}'.format(key)] = result['items']
+                kwargs['found_{}_count'.format(key)] = result['count']
+                kwargs['found_{}_next_cursor'.format(key)] = result['next_cursor']
+                if count_strategy != 'exact':
+                    kwargs['found_{}_count_is_exact'.format(key)] = result['count_is_exact']
+            response = Response(kwargs, status=status.HTTP_200_OK)
+            result_count = sum(result['count'] for result in results)
+        if logged:
+            self.record_query(scope, result_count, started)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+
+class CommonSearchBatchAPI(CommonSearchAPI):
+    """
+    Runs a list of CommonSearchAPI queries POSTed as
+    {"queries": [{"name": ..., "scope": ..., "scope_2": ..., "cursor": ...}, ...]}
+    and returns their responses in the same order as
+    {"results": [{"status": ..., "data": ...}, ...]}.
+
+    Every query takes the query parameters of CommonSearchAPI. Authentication,
+    the viewer's social graph, the search backend, the parsed names and the
+    metrics are shared by all of them.
+    """
+
+    http_method_names = ['post', 'options']
+
+    MAX_QUERIES = 10
+
+    def get_queries(self):
+        queries = self.request.data.get('queries') if isinstance(self.request.data, dict) else None
+        if not isinstance(queries, list) or not queries:
+            raise BadRequest("Expected a list of queries")
+        if len(queries) > self.MAX_QUERIES:
+            raise BadRequest("At most {} queries are allowed".format(self.MAX_QUERIES))
+        for index, params in enumerate(queries):
+            if not isinstance(params, dict) or any(isinstance(value, (dict, list)) for value in params.values()):
+                raise BadRequest("Invalid query: {}".format(index))
+            if 'stream' in params:
+                raise BadRequest("Unexpected parameter: stream")
+        return queries
+
+    def get_search_view(self, params, parsed_queries):
+        http_request = copy.copy(self.request._request)
+        http_request.method = 'GET'
+        # The batch as a whole is never answered with a 304.
+        http_request.META = dict(http_request.META)
+        http_request.META.pop('HTTP_IF_NONE_MATCH', None)
+        http_request.GET = QueryDict(mutable=True)
+        for key, value in params.items():
+            if value is not None:
+                http_request.GET[key] = str(value)
+        request = Request(http_request, authenticators=())
+        request.user, request.auth = self.request.user, self.request.auth
+
+        view = CommonSearchAPI()
+        view.request, view.args, view.kwargs, view.format_kwarg = request, (), {}, None
+        view._social_graph = self.get_social_graph()
+        view._search_backend = self.get_search_backend()
+        view._metrics = self.get_metrics()
+        key = (request.query_params.get('name'), view.get_min_query_length())
+        if key not in parsed_queries:
+            parsed_queries[key] = parse_query(*key)
+        view._query = parsed_queries[key]
+        return view
+
+    def post(self, request, *args, **kwargs):
+        results, parsed_queries = [], {}
+        for params in self.get_queries():
+            try:
+                view = self.get_search_view(params, parsed_queries)
+                response = view.list(view.request)
+            except APIException as exc:
+                results.append({'status': exc.status_code, 'data': {'detail': exc.detail}})
+            else:
+                results.append({'status': response.status_code, 'data': response.data})
+        return Response({'results': results}, status=status.HTTP_200_OK)